@@ -0,0 +1,72 @@
+"""
+Check that the re2-backed patterns from compile_linear() behave exactly like `re`.
+
+re2 treats \\b, \\w and \\s as ASCII-only, so LinearPattern only hands it ASCII text; this
+compares every shared pattern against a plain `re` compile on ASCII, accented and
+non-breaking-space samples.
+
+Usage:
+    python backend/check_linear_patterns.py
+"""
+import re
+import sys
+
+from rag_core import re2, LinearPattern, UNIT_PATTERN, NUTRITION_HINTS, COOKING_VERB_PATTERN, COMBINE_PATTERN
+from scan_and_prepare_updates import NOISY_PATTERN
+
+PATTERNS = {
+    'UNIT_PATTERN': UNIT_PATTERN,
+    'NUTRITION_HINTS': NUTRITION_HINTS,
+    'COOKING_VERB_PATTERN': COOKING_VERB_PATTERN,
+    'COMBINE_PATTERN': COMBINE_PATTERN,
+    'NOISY_PATTERN': NOISY_PATTERN,
+}
+SAMPLES = [
+    '2 cups flour',
+    '1 g salt',
+    'Add butter into pan.',
+    'Combine flour, sugar and eggs in a bowl;',
+    'Calories: 250 per serving, Vitamin C 2%',
+    'Preheat the oven to 180 degrees',
+    'Serve the gâteau warm with cream.',
+    'Crème brûlée',
+    'Add\xa0butter into pan.',
+    'Mix\xa0flour, sugar in\xa0a bowl;',
+    '200\xa0g gula pasir',
+    'Add\vbutter into pan.',
+    'Tambahkan 2 siung bawang putih',
+]
+
+
+def results(pattern, text):
+    """Everything the repo reads from a pattern: search span/groups, match, finditer groups and sub."""
+    m = pattern.search(text)
+    head = pattern.match(text)
+    return (
+        m and (m.span(), m.groups()),
+        head and (head.span(), head.groups()),
+        [f.groups() for f in pattern.finditer(text)],
+        pattern.sub(' ', text),
+    )
+
+
+def main():
+    if re2 is None:
+        print('google-re2 is not installed; compile_linear() uses `re` only, nothing to check.')
+        return 0
+    failures = 0
+    for name, pattern in PATTERNS.items():
+        if not isinstance(pattern, LinearPattern):
+            print(f'{name}: re2 rejected the pattern, compiled with `re` only')
+            continue
+        reference = re.compile(pattern.pattern)
+        for text in SAMPLES:
+            if results(pattern, text) != results(reference, text):
+                failures += 1
+                print(f'MISMATCH {name}: {text!r}')
+    print(f'{failures} mismatch(es) across {len(PATTERNS)} patterns x {len(SAMPLES)} samples')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
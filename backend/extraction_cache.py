@@ -0,0 +1,67 @@
+"""Content-addressed on-disk cache for LLM recipe extractions.
+
+Each entry is one JSON file under the cache dir, named by a sha256 over length-prefixed key
+parts (provider, model, prompt version, language, recipe name, raw text), so re-running an
+updater on unchanged recipes costs a hash instead of an LLM call. Entries are re-validated on
+read and evicted when they no longer have the expected shape.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+DEFAULT_CACHE_DIR = 'backend/.cache/extractions'
+
+
+class Extraction(BaseModel):
+    ingredients: List[str] = []
+    instructions: List[str] = []
+    text_id: str = ''
+
+
+def make_key(*parts) -> str:
+    """sha256 over the parts, each prefixed with its 8-byte length (no ambiguity between parts)."""
+    h = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, key: str) -> str:
+        # two-level fan-out keeps directories small on large collections
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached extraction for `key`, or None on a miss or an invalid entry."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return Extraction.model_validate(json.load(f)).model_dump()
+        except FileNotFoundError:
+            return None
+        except (ValueError, ValidationError):
+            # corrupt or outdated entry: drop it so the next put rewrites it
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key: str, value: dict):
+        """Validate and store `value`; written to a temp file first so readers never see half an entry."""
+        entry = Extraction.model_validate(value).model_dump()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
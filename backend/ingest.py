@@ -1,6 +1,6 @@
 # === ingest.py (VERSI KHUSUS JSON KAMU) ===
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
+from qdrant_client.models import VectorParams, Distance, PointStruct, PayloadSchemaType
 from sentence_transformers import SentenceTransformer
 # import rag_core helper if available
 try:
@@ -42,6 +42,12 @@ def recreate_collection():
         collection_name=COLLECTION_NAME,
         vectors_config=VectorParams(size=384, distance=Distance.COSINE)
     )
+    # Index keyword untuk pencarian nama (update_single_recipe_by_name memfilter di sisi server)
+    client.create_payload_index(
+        collection_name=COLLECTION_NAME,
+        field_name="recipe_name_lc",
+        field_schema=PayloadSchemaType.KEYWORD
+    )
     print(f"✨ Collection '{COLLECTION_NAME}' siap!")
 
 def format_nutrients(nutrients_data):
@@ -102,6 +108,7 @@ def ingest(batch_size: int = 256):
 
         payload = {
             "recipe_name": name,
+            "recipe_name_lc": name.strip().casefold(),  # nama ternormalisasi untuk filter ber-index
             "text": full_text,
             "steps": steps_list,  # Store as list for easy processing
             "steps_text": steps_text,  # Store joined version for backward compatibility
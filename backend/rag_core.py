@@ -1,9 +1,14 @@
 from qdrant_client import QdrantClient
+from qdrant_client.models import SetPayload, SetPayloadOperation, PayloadSelectorInclude
 from sentence_transformers import SentenceTransformer
 import os
 from dotenv import load_dotenv
 import re
+import json
 import time
+import random
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # spaCy (optional) - loaded lazily
 _spacy_nlp = None
@@ -24,15 +29,67 @@ def get_spacy():
         _spacy_nlp = None
         return None
 
+# google-re2 (optional) - linear-time regex engine, no backtracking on long/odd LLM text
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# re2's \b/\w are ASCII-only and its \s is just [\t\n\f\r ], while `re` uses Unicode rules
+# (and also counts \v and \x1c-\x1f as \s): text with any of those has to go through `re`
+_RE2_UNSAFE_CHARS = re.compile(r'[\v\x1c-\x1f]')
+
+def re2_safe(text: str) -> bool:
+    """True when re2 and `re` are guaranteed to agree on `text`."""
+    return text.isascii() and not _RE2_UNSAFE_CHARS.search(text)
+
+class LinearPattern:
+    """A pattern compiled twice: re2 for plain-ASCII text (the common case), `re` for the rest,
+    so the result is always the same as `re` would give.
+    """
+    def __init__(self, pattern: str, linear, fallback):
+        self.pattern = pattern
+        self._linear = linear
+        self._fallback = fallback
+
+    def _pick(self, text):
+        return self._linear if re2_safe(text) else self._fallback
+
+    def search(self, text, *args):
+        return self._pick(text).search(text, *args)
+
+    def match(self, text, *args):
+        return self._pick(text).match(text, *args)
+
+    def finditer(self, text, *args):
+        return self._pick(text).finditer(text, *args)
+
+    def findall(self, text, *args):
+        return self._pick(text).findall(text, *args)
+
+    def sub(self, repl, text, count=0):
+        return self._pick(text).sub(repl, text, count)
+
+def compile_linear(pattern: str):
+    """Compile with re2 when installed; fall back to `re` (also for patterns re2 rejects).
+    Use inline flags like (?i) since re2 does not take `re` flag constants.
+    """
+    compiled = re.compile(pattern)
+    if re2 is not None:
+        try:
+            return LinearPattern(pattern, re2.compile(pattern), compiled)
+        except Exception:
+            pass
+    return compiled
+
 load_dotenv()
 
 # --- GLOBAL PATTERNS ---
 # Reusable compiled regexes and blacklists used across functions
-UNIT_PATTERN = re.compile(r'\b(?:cup|cups|tbsp|tbs|tsp|tablespoon|tablespoons|teaspoon|teaspoons|gram|g|kg|ml|l|oz|ounce|ounces|pound|pounds|lb|lbs|slice|slices|clove|cloves|inch|buah|siung|biji|lembar|potong)\b', re.IGNORECASE)
+UNIT_PATTERN = compile_linear(r'(?i)\b(?:cup|cups|tbsp|tbs|tsp|tablespoon|tablespoons|teaspoon|teaspoons|gram|g|kg|ml|l|oz|ounce|ounces|pound|pounds|lb|lbs|slice|slices|clove|cloves|inch|buah|siung|biji|lembar|potong)\b')
 TIME_TEMPERATURE_PATTERN = re.compile(r'\b(?:minute|minutes|min|hour|hours|hr|sec|second|seconds|degree|degrees|°|°c|°f|celsius|fahrenheit|oven|bake|preheat|roast|simmer|broil)\b', re.IGNORECASE)
-NUTRITION_HINTS = re.compile(
-    r'(%|vitamin\b|kcal\b|calorie|calories|kj\b|mg\b|per serving|serving|\bprotein\b|\bfat\b|\bsaturated fat\b|\bcholesterol\b|\bsodium\b|\bcarbohydrate\b|\bfiber\b|\bsugars?\b|\biron\b|\bpotassium\b|\bcalcium\b)',
-    re.IGNORECASE
+NUTRITION_HINTS = compile_linear(
+    r'(?i)(%|vitamin\b|kcal\b|calorie|calories|kj\b|mg\b|per serving|serving|\bprotein\b|\bfat\b|\bsaturated fat\b|\bcholesterol\b|\bsodium\b|\bcarbohydrate\b|\bfiber\b|\bsugars?\b|\biron\b|\bpotassium\b|\bcalcium\b)'
 )
 def extract_nutrition_info(text: str) -> list:
     """Extract nutrition-related lines from raw text as a separate list.
@@ -66,12 +123,115 @@ KITCHEN_TOOLS = {
     'pan','pot','saucepan','bowl','sheet','baking sheet','plate','dish','spoon','fork','knife','glass',
     'cup','container','mixer','blender','skillet','oven','tray'
 }
+# Kata-kata junk yang bukan bahan (dipakai saat parsing bahan dari kalimat instruksi)
+JUNK_WORDS = frozenset({
+    'first', 'second', 'third', 'fourth', 'one', 'two', 'three', 'four', 'both',
+    'remaining', 'unused', 'some', 'each', 'all', 'other', 'another', 'more',
+    'oven', 'pan', 'bowl', 'sheet', 'heat', 'temperature', 'degrees', 'strips',
+    'crust', 'lattice', 'mound', 'pieces', 'slices', 'mixture', 'position'
+})
+# Kata kerja yang biasanya diikuti dengan bahan: group(2) = frasa bahan
+COOKING_VERB_PATTERN = compile_linear(
+    r'(?i)\b(add|melt|mix|stir|combine|beat|whisk|fold|pour|peel|core|slice|dice|chop|cut|spread|sprinkle|brush|use|place|layer)\b'
+    r'\s+([^,.;]+?)(?:\s+(?:in|into|over|on|to|until|and\s+(?:stir|cook|bring)|,|\.))'
+)
+# "Combine X, Y, and Z" / "Mix A, B, C": group(2) = daftar bahan
+COMBINE_PATTERN = compile_linear(r'(?i)^(combine|mix)\s+([^;]+?)(?:\s+in\s+|\s*;)')
+COMBINE_SPLIT_PATTERN = re.compile(r',\s*(?:and\s+)?|\s+and\s+')
+ARTICLE_PATTERN = re.compile(r'\b(the|a|an|some|all|both|remaining)\b\s*', re.IGNORECASE)
+# Placeholder lines for empty sections in format_recipe_output, per language
+RECIPE_OUTPUT_LABELS = {
+    "indonesian": {
+        "no_ingredients": "- (Bahan tidak terdeteksi)",
+        "no_steps": "- (Langkah tidak tersedia)",
+        "no_nutrition": "- Tidak tersedia",
+    },
+    "english": {
+        "no_ingredients": "- (Ingredients not detected)",
+        "no_steps": "- (Steps not available)",
+        "no_nutrition": "- Not available",
+    },
+}
+# Respons "tidak ditemukan" / "tidak relevan" per bahasa; search_recipes mengembalikan salinan dangkal.
+# Teks low-score berisi placeholder {query} yang diisi saat dipakai.
+NOT_FOUND_RESPONSES = {
+    "indonesian": {
+        "recipe_name": "Tidak Ditemukan",
+        "text": "## Maaf, Resep Tidak Ditemukan 😔\n\n"
+               "Resep yang Anda cari tidak ada di database kami.\n\n"
+               "### 💡 Saran:\n"
+               "- Coba kata kunci yang berbeda\n"
+               "- Periksa ejaan resep\n"
+               "- Cari resep serupa yang mungkin tersedia\n\n"
+               "**Mau saya rekomendasikan resep populer lainnya?** 🍽️",
+        "score": 0.0,
+        "not_found": True
+    },
+    "english": {
+        "recipe_name": "Not Found",
+        "text": "## Sorry, Recipe Not Found 😔\n\n"
+               "The recipe you're looking for is not in our database.\n\n"
+               "### 💡 Suggestions:\n"
+               "- Try different keywords\n"
+               "- Check the recipe spelling\n"
+               "- Search for similar recipes\n\n"
+               "**Would you like me to recommend other popular recipes?** 🍽️",
+        "score": 0.0,
+        "not_found": True
+    },
+}
+LOW_SCORE_RESPONSES = {
+    "indonesian": {
+        "recipe_name": "Tidak Relevan",
+        "text": "## Hmm, Tidak Ada yang Cocok 🤔\n\n"
+               "Saya menemukan beberapa resep, tapi tidak ada yang cocok dengan **'{query}'**.\n\n"
+               "### 💡 Coba:\n"
+               "- Gunakan nama resep yang lebih spesifik\n"
+               "- Cari berdasarkan bahan utama\n"
+               "- Tanyakan kategori makanan (misal: 'kue', 'ayam', 'pasta')\n\n"
+               "**Atau mau saya carikan resep populer?** 🍳",
+        "score": 0.0,
+        "not_found": True
+    },
+    "english": {
+        "recipe_name": "Not Relevant",
+        "text": "## Hmm, No Match Found 🤔\n\n"
+               "I found some recipes, but none match **'{query}'** well.\n\n"
+               "### 💡 Try:\n"
+               "- Use more specific recipe names\n"
+               "- Search by main ingredient\n"
+               "- Ask for food categories (e.g., 'cake', 'chicken', 'pasta')\n\n"
+               "**Or would you like popular recipe suggestions?** 🍳",
+        "score": 0.0,
+        "not_found": True
+    },
+}
+# Reusable decoder for pulling a JSON object out of free-form LLM replies
+JSON_DECODER = json.JSONDecoder()
+# Leading/trailing ``` fences that LLMs sometimes wrap markdown replies in
+CODE_FENCE_PATTERN = re.compile(r'^```[a-zA-Z]*\s*|\s*```$')
 
 # --- CONFIG ---
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# gRPC transport (lower latency, multiplexed); set QDRANT_PREFER_GRPC=false if only REST is reachable
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "recipes")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+# Model fallback order for llm_extract_structured (also part of the extraction cache key)
+LLM_EXTRACT_MODELS = ("gemini-1.5-flash", "gemini-1.5-pro", "gemini-pro")
+# Part of the extraction cache key: bump when llm_extract_structured's prompt or its
+# post-processing (normalize_ingredient, instruction cleanup) changes, so old entries stop matching
+LLM_EXTRACT_PROMPT_VERSION = "1"
+# Concurrent Gemini calls in llm_extract_structured_batch (the SDK has no batch endpoint)
+LLM_BATCH_WORKERS = 8
+# Re-asks (with the parse error fed back) before a malformed reply falls back to local extraction
+LLM_JSON_RETRIES = 2
+# Retries of a rate-limited (429) Gemini call before moving to the next model; the wait starts at
+# LLM_RATE_LIMIT_BACKOFF seconds and doubles each time (with jitter, so concurrent workers spread out)
+LLM_RATE_LIMIT_RETRIES = 4
+LLM_RATE_LIMIT_BACKOFF = 1.0
 
 # --- SETUP AI (Gemini) ---
 genai_available = False
@@ -94,6 +254,27 @@ except Exception as e:
     print(f"⚠️ Error setup Gemini: {e}")
     genai = None
 
+try:
+    from google.api_core.exceptions import ResourceExhausted
+except ImportError:
+    ResourceExhausted = None
+
+def is_rate_limited(exc: Exception) -> bool:
+    """True for a provider 429 (google-api-core's ResourceExhausted or anything with code 429)."""
+    if ResourceExhausted is not None and isinstance(exc, ResourceExhausted):
+        return True
+    return getattr(exc, 'code', None) == 429
+
+def generate_with_backoff(model, contents, **kwargs):
+    """model.generate_content, retried with exponential backoff while the provider answers 429."""
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        try:
+            return model.generate_content(contents, **kwargs)
+        except Exception as e:
+            if attempt == LLM_RATE_LIMIT_RETRIES or not is_rate_limited(e):
+                raise
+            time.sleep(LLM_RATE_LIMIT_BACKOFF * (2 ** attempt) * random.uniform(1.0, 1.5))
+
 # --- CACHE ---
 _model = None
 _client = None
@@ -108,17 +289,85 @@ def get_model():
 def get_client():
     global _client
     if _client is None:
-        _client = QdrantClient(url=QDRANT_URL, prefer_grpc=False)
+        # One shared client per process; keepalive pings keep the channel warm between calls
+        _client = QdrantClient(
+            url=QDRANT_URL,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
+            grpc_options={"grpc.keepalive_time_ms": 30000},
+            timeout=60
+        )
     return _client
 
+# Skor kualitas daftar bahan (0-100) disimpan di payload, supaya skrip perbaikan
+# bisa memfilter titik yang perlu diproses di sisi server (lihat update_qdrant_ingredients)
+INGREDIENTS_QUALITY_FIELD = "ingredients_quality"
+INGREDIENTS_QUALITY_MIN = 50
+
+def ingredients_quality(ings) -> int:
+    """Percentage (0-100) of items that look like real ingredients (>= 3 chars with a letter)."""
+    if not ings:
+        return 0
+    good = 0
+    for i in ings:
+        s = str(i).strip()
+        if len(s) >= 3 and any(c.isalpha() for c in s):
+            good += 1
+    return good * 100 // len(ings)
+
+def set_payload_batch(updates, wait: bool = True) -> int:
+    """Apply per-point payload patches [(point_id, payload), ...] in a single request.
+    Payload keys are merged into the existing payload (same semantics as set_payload).
+    Patches that set `ingredients` also get a fresh `ingredients_quality` score (unless they
+    carry one), so the denormalized score never goes stale whichever script writes ingredients.
+    Returns the number of points written.
+    """
+    updates = [
+        (pid, {**payload, INGREDIENTS_QUALITY_FIELD: ingredients_quality(payload['ingredients'])})
+        if 'ingredients' in payload and INGREDIENTS_QUALITY_FIELD not in payload else (pid, payload)
+        for pid, payload in updates
+    ]
+    if not updates:
+        return 0
+    get_client().batch_update_points(
+        collection_name=COLLECTION_NAME,
+        update_operations=[
+            SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[pid]))
+            for pid, payload in updates
+        ],
+        wait=wait
+    )
+    return len(updates)
+
+def retrieve_payloads(ids, fields) -> dict:
+    """Fetch only the given payload fields for many point ids in one request: {id: payload}."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    records = get_client().retrieve(
+        collection_name=COLLECTION_NAME,
+        ids=ids,
+        with_payload=PayloadSelectorInclude(include=list(fields)),
+        with_vectors=False
+    )
+    return {r.id: (r.payload or {}) for r in records}
+
 def embed_text(text: str):
     return get_model().encode(text).tolist()
 
+def embed_texts(texts, batch_size: int = 64) -> list:
+    """Embed many texts in one batched model call; returns one vector (list) per text."""
+    texts = list(texts)
+    if not texts:
+        return []
+    return get_model().encode(texts, batch_size=batch_size).tolist()
+
 # ==========================================
 # LANGUAGE DETECTION
 # ==========================================
+@functools.lru_cache(maxsize=512)
 def detect_language(query: str) -> str:
-    """Deteksi bahasa dari query user"""
+    """Deteksi bahasa dari query user (di-cache: query yang sama sering diulang)"""
     indonesian_keywords = [
         'resep', 'cara', 'membuat', 'memasak', 'bahan', 'apa', 'bagaimana',
         'dengan', 'untuk', 'yang', 'dan', 'adalah', 'ini', 'itu'
@@ -142,7 +391,17 @@ def detect_language(query: str) -> str:
 # TEXT CLEANER (PENTING: Hapus redundansi)
 # ==========================================
 def clean_garbage_text(text: str, title: str) -> str:
-    """Membersihkan teks sampah sebelum diproses AI/Local."""
+    """Membersihkan teks sampah sebelum diproses AI/Local.
+
+    Hasil di-cache per (text, title): satu request bisa membersihkan teks yang sama beberapa kali.
+    """
+    if not isinstance(text, str) or not isinstance(title, str):
+        return _clean_garbage_text.__wrapped__(text, title)
+    return _clean_garbage_text(text, title)
+
+
+@functools.lru_cache(maxsize=128)
+def _clean_garbage_text(text: str, title: str) -> str:
     cleaned = text.strip()
 
     # 1. Hapus Judul jika nempel di awal
@@ -173,6 +432,13 @@ def clean_garbage_text(text: str, title: str) -> str:
 # ==========================================
 def extract_ingredients_from_text(text: str) -> list:
     """Extract bahan dari raw text dengan pattern matching yang lebih baik"""
+    if not isinstance(text, str):
+        return list(_extract_ingredients_from_text.__wrapped__(text))
+    return list(_extract_ingredients_from_text(text))
+
+
+@functools.lru_cache(maxsize=128)
+def _extract_ingredients_from_text(text: str) -> tuple:
     ingredients = []
 
     # Units that are likely to be ingredients (expand as needed)
@@ -309,7 +575,7 @@ def extract_ingredients_from_text(text: str) -> list:
                     candidate = keep[0].strip()
                     # Reject if candidate is purely a unit/measurement or a nutrition hint
                     if len(candidate) > 1 and candidate.lower() not in seen:
-                        if UNIT_PATTERN.search(candidate) and not re.search(r'[A-Za-z]{3,}', re.sub(UNIT_PATTERN.pattern, '', candidate, flags=re.IGNORECASE)):
+                        if UNIT_PATTERN.search(candidate) and not re.search(r'[A-Za-z]{3,}', UNIT_PATTERN.sub('', candidate)):
                             # candidate contains only units/measurements -> skip
                             continue
                         if NUTRITION_HINTS.search(candidate) or TIME_TEMPERATURE_PATTERN.search(candidate):
@@ -355,7 +621,7 @@ def extract_ingredients_from_text(text: str) -> list:
         s0 = s.lower()
         s0 = re.sub(r'\([^)]*\)', ' ', s0)  # drop parentheses
         s0 = re.sub(r'[^a-z\s]', ' ', s0)
-        s0 = re.sub(UNIT_PATTERN.pattern, ' ', s0, flags=re.IGNORECASE)
+        s0 = UNIT_PATTERN.sub(' ', s0)
         s0 = re.sub(r'\b(?:sliced|chopped|diced|minced|fresh|unsalted|salted|medium|large|small|peeled|cored|thin|soft|pieces|piece)\b',' ', s0)
         s0 = re.sub(r'\s+', ' ', s0).strip()
         parts = s0.split()
@@ -405,18 +671,40 @@ def extract_ingredients_from_text(text: str) -> list:
 
     # If we found high-confidence final ingredients, return them; otherwise fall back to previous cleaned list
     if final_ingredients:
-        return final_ingredients
+        return tuple(final_ingredients)
 
-    return cleaned_ingredients
+    return tuple(cleaned_ingredients)
 
 # ==========================================
 # LOCAL FORMATTER (Offline Fallback)
 # ==========================================
-def local_format_to_markdown(raw_text: str, recipe_name: str, language: str = "english", ingredients_list=None) -> str:
+def _iter_steps(sentences, ing_lowers):
+    """Yield kalimat langkah yang lolos filter (bukan baris bahan, tanpa penomoran)."""
+    for s in sentences:
+        s = s.strip()
+        if len(s) < 10:
+            continue
+
+        # Skip if this sentence is likely an ingredient-only line:
+        # - short (<=8 words) and contains a unit, OR exactly matches an extracted ingredient
+        if len(s.split()) <= 8 and UNIT_PATTERN.search(s) is not None:
+            continue
+        s_lower = s.lower()
+        if any(s_lower.startswith(ing) for ing in ing_lowers):
+            continue
+
+        # Hapus penomoran ganda
+        s = re.sub(r'^\d+[\.\)]\s*', '', s)
+
+        if s:
+            yield s
+
+
+def local_format_to_markdown(raw_text: str, recipe_name: str, language: str = "english", ingredients_list=None, cleaned_text=None) -> str:
     print(f"🔧 LOCAL FORMATTER (Offline): {recipe_name}")
 
-    # Bersihkan dulu!
-    text = clean_garbage_text(raw_text, recipe_name)
+    # Bersihkan dulu! (kecuali caller sudah mengirim hasil clean_garbage_text)
+    text = cleaned_text if cleaned_text is not None else clean_garbage_text(raw_text, recipe_name)
 
     # Jika payload sudah menyertakan daftar bahan, pakai itu. Kalau tidak, coba ekstrak secara heuristik
     if ingredients_list:
@@ -447,74 +735,45 @@ def local_format_to_markdown(raw_text: str, recipe_name: str, language: str = "e
 
     # Split menjadi steps
     sentences = re.split(r'(?<=[.!?])\s+', text_for_steps)
-    steps = []
-
-    for s in sentences:
-        s = s.strip()
-        if len(s) < 10: 
-            continue
-        
-        # Skip if this sentence is likely an ingredient-only line:
-        # - short (<=8 words) and contains a unit, OR exactly matches an extracted ingredient
-        short_words = len(s.split()) <= 8
-        contains_unit = UNIT_PATTERN.search(s) is not None
-        matches_exact_ing = any(s.lower().strip().startswith(ing.lower()) or s.lower().strip() == ing.lower() for ing in ingredients)
-        if (short_words and contains_unit) or matches_exact_ing:
-            continue
-            
-        # Hapus penomoran ganda
-        s = re.sub(r'^\d+[\.\)]\s*', '', s)
-        
-        if s:
-            steps.append(s)
+    steps = list(_iter_steps(sentences, [ing.lower() for ing in ingredients]))
 
     # Format berdasarkan bahasa
     if language == "indonesian":
-        md = [f"## {recipe_name}\n"]
-        md.append("### 🛒 Bahan-bahan")
-        
+        md = [f"## {recipe_name}\n", "### 🛒 Bahan-bahan"]
         if ingredients:
-            for ing in ingredients:
-                md.append(f"- {ing}")
+            md += [f"- {ing}" for ing in ingredients]
         else:
             md.append("- (Bahan tidak terdeteksi, lihat instruksi di bawah)")
-        
+
         md.append("\n### 🍳 Cara Memasak")
         if steps:
-            for i, step in enumerate(steps, 1):
-                md.append(f"{i}. {step}")
+            md += [f"{i}. {step}" for i, step in enumerate(steps, 1)]
         else:
             md.append(f"1. {text}")
 
         # Nutrition section (if available)
         md.append("\n### ℹ️ Informasi Nutrisi")
         if nutrition_info:
-            for item in nutrition_info:
-                md.append(f"- {item}")
+            md += [f"- {item}" for item in nutrition_info]
         else:
             md.append("- Tidak tersedia")
     else:
-        md = [f"## {recipe_name}\n"]
-        md.append("### 🛒 Ingredients")
-        
+        md = [f"## {recipe_name}\n", "### 🛒 Ingredients"]
         if ingredients:
-            for ing in ingredients:
-                md.append(f"- {ing}")
+            md += [f"- {ing}" for ing in ingredients]
         else:
             md.append("- (Ingredients not auto-detected, see instructions)")
-        
+
         md.append("\n### 🍳 Instructions")
         if steps:
-            for i, step in enumerate(steps, 1):
-                md.append(f"{i}. {step}")
+            md += [f"{i}. {step}" for i, step in enumerate(steps, 1)]
         else:
             md.append(f"1. {text}")
 
         # Nutrition section (if available)
         md.append("\n### ℹ️ Nutrition Information")
         if nutrition_info:
-            for item in nutrition_info:
-                md.append(f"- {item}")
+            md += [f"- {item}" for item in nutrition_info]
         else:
             md.append("- Not available")
     
@@ -541,8 +800,7 @@ def format_strict_from_payload(payload: dict, language: str = "indonesian") -> s
 
     # Build instruction steps as list split by ';'
     if isinstance(steps_raw, list) and steps_raw:
-        joined = "; ".join([str(s).strip() for s in steps_raw if str(s).strip()])
-        instr_list = [seg.strip() for seg in joined.split(";") if seg.strip()]
+        instr_list = [seg.strip() for s in steps_raw for seg in str(s).split(";") if seg.strip()]
     elif isinstance(steps_text, str) and steps_text.strip():
         instr_list = [seg.strip() for seg in steps_text.split(";") if seg.strip()]
     else:
@@ -597,9 +855,11 @@ def format_strict_from_payload(payload: dict, language: str = "indonesian") -> s
     return "\n".join(md)
 
 
-def extract_steps(raw_text: str, recipe_name: str, ingredients_list=None) -> list:
-    """Return cleaned list of instruction steps (used for structured responses)."""
-    text = clean_garbage_text(raw_text, recipe_name)
+def extract_steps(raw_text: str, recipe_name: str, ingredients_list=None, cleaned_text=None) -> list:
+    """Return cleaned list of instruction steps (used for structured responses).
+    Pass `cleaned_text` when clean_garbage_text has already been run on raw_text.
+    """
+    text = cleaned_text if cleaned_text is not None else clean_garbage_text(raw_text, recipe_name)
 
     # If ingredients_list provided, remove their explicit lines from text.
     # If not provided, attempt to extract ingredients and remove their lines to avoid mixing.
@@ -643,6 +903,72 @@ def extract_steps(raw_text: str, recipe_name: str, ingredients_list=None) -> lis
     return final
 
 
+# ==========================================
+# INGREDIENTS FROM INSTRUCTION STEPS
+# ==========================================
+def extract_ingredients_from_steps(steps) -> list:
+    """Ambil bahan dari kalimat instruksi (kata kerja masak + frasa bahan).
+
+    Hasil di-cache per tuple langkah, karena hit yang sama sering diformat ulang.
+    """
+    return list(_extract_ingredients_from_steps(tuple(steps)))
+
+
+@functools.lru_cache(maxsize=1024)
+def _extract_ingredients_from_steps(instruction_list: tuple) -> tuple:
+    ingredients = []
+    ingredients_set = set()
+    
+    for step in instruction_list:
+        # Pattern khusus untuk "Combine X, Y, and Z" atau "Mix A, B, C"
+        combine_match = COMBINE_PATTERN.match(step)
+        if combine_match:
+            items_text = combine_match.group(2)
+            # Split by "and" dan ","
+            parts = COMBINE_SPLIT_PATTERN.split(items_text)
+            for part in parts:
+                part = part.strip()
+                part = ARTICLE_PATTERN.sub('', part)
+                part = re.sub(r'\s+', ' ', part).strip()
+                
+                if len(part) < 3:
+                    continue
+                # Must contain at least one food-like word (3+ letters, not a junk word)
+                part_lower = part.lower()
+                if not any(len(w) >= 3 and w not in JUNK_WORDS for w in part_lower.split()):
+                    continue
+
+                if part_lower not in ingredients_set:
+                    ingredients.append(part)
+                    ingredients_set.add(part_lower)
+            continue
+        
+        # Cari pola: kata kerja + bahan
+        # Contoh: "Melt butter", "Add flour and sugar", "Peel and core apples"
+        matches = COOKING_VERB_PATTERN.finditer(step)
+        for match in matches:
+            ingredient_phrase = match.group(2).strip()
+            # Clean up
+            ingredient_phrase = ARTICLE_PATTERN.sub('', ingredient_phrase)
+            ingredient_phrase = re.sub(r'\s+', ' ', ingredient_phrase).strip()
+            
+            # Filter out junk
+            if len(ingredient_phrase) < 3:
+                continue
+
+            # Must contain at least one food-like word (3+ letters, not a junk word);
+            # this also rejects single junk words and all-junk phrases in one pass
+            ing_lower = ingredient_phrase.lower()
+            if not any(len(w) >= 3 and w not in JUNK_WORDS for w in ing_lower.split()):
+                continue
+
+            if ing_lower not in ingredients_set:
+                ingredients.append(ingredient_phrase)
+                ingredients_set.add(ing_lower)
+
+    return tuple(ingredients)
+
+
 # ==========================================
 # MAIN FORMAT FUNCTION - CONSISTENT OUTPUT
 # ==========================================
@@ -665,10 +991,18 @@ def format_recipe_output(payload: dict, language: str = "indonesian") -> str:
         payload: Dictionary dari Qdrant dengan keys: recipe_name, steps, nutrients
         language: "indonesian" atau "english"
     """
+    return _format_recipe_output(payload, RECIPE_OUTPUT_LABELS["indonesian" if language == "indonesian" else "english"])
+
+
+def _format_recipe_output(payload: dict, labels: dict) -> str:
     name = payload.get("recipe_name", "Tanpa Judul")
+    steps = payload.get("steps", [])
+    steps_text = payload.get("steps_text")
+    nutrients = payload.get("nutrients", [])
+    nutrients_text = payload.get("nutrients_text")
+    raw_text = payload.get("text", "")
     
     # 1. AMBIL STEPS (dari payload.steps yang sudah berbentuk list)
-    steps = payload.get("steps", [])
     if isinstance(steps, list) and steps:
         # Jika steps adalah list of strings, split per kalimat untuk lebih readable
         instruction_list = []
@@ -685,9 +1019,8 @@ def format_recipe_output(payload: dict, language: str = "indonesian") -> str:
                     sent = re.sub(r"cookin['\']?\s*mama", '', sent, flags=re.IGNORECASE).strip()
                     if len(sent) > 15:  # Only keep meaningful sentences
                         instruction_list.append(sent)
-    elif isinstance(payload.get("steps_text"), str):
+    elif isinstance(steps_text, str):
         # Fallback ke steps_text jika ada
-        steps_text = payload.get("steps_text", "")
         instruction_list = []
         for step in steps_text.split(";"):
             sentences = re.split(r'(?<=[.!?])\s+', step.strip())
@@ -698,162 +1031,53 @@ def format_recipe_output(payload: dict, language: str = "indonesian") -> str:
                     instruction_list.append(sent)
     else:
         # Last fallback: extract from raw text
-        raw_text = payload.get("text", "")
         instruction_list = extract_steps(raw_text, name)
     
     # 2. EKSTRAK INGREDIENTS dari instruction text dengan pendekatan berbeda
     # Karena ingredients ada di dalam instructions, kita parse dari kata kerja
-    ingredients = []
-    ingredients_set = set()
-    
-    # Kata kerja yang biasanya diikuti dengan bahan
-    cooking_verbs = r'\b(add|melt|mix|stir|combine|beat|whisk|fold|pour|peel|core|slice|dice|chop|cut|spread|sprinkle|brush|use|place|layer)\b'
-    
-    # Kata-kata junk yang harus difilter
-    junk_words = {'first', 'second', 'third', 'fourth', 'one', 'two', 'three', 'four', 'both', 
-                  'remaining', 'unused', 'some', 'each', 'all', 'other', 'another', 'more',
-                  'oven', 'pan', 'bowl', 'sheet', 'heat', 'temperature', 'degrees', 'strips',
-                  'crust', 'lattice', 'mound', 'pieces', 'slices', 'mixture', 'position'}
-    
-    for step in instruction_list:
-        # Pattern khusus untuk "Combine X, Y, and Z" atau "Mix A, B, C"
-        combine_match = re.match(r'^(combine|mix)\s+([^;]+?)(?:\s+in\s+|\s*;)', step, re.IGNORECASE)
-        if combine_match:
-            items_text = combine_match.group(2)
-            # Split by "and" dan ","
-            parts = re.split(r',\s*(?:and\s+)?|\s+and\s+', items_text)
-            for part in parts:
-                part = part.strip()
-                part = re.sub(r'\b(the|a|an|some|all|both|remaining)\b\s*', '', part, flags=re.IGNORECASE)
-                part = re.sub(r'\s+', ' ', part).strip()
-                
-                if len(part) < 3:
-                    continue
-                words = part.lower().split()
-                if len(words) == 1 and words[0] in junk_words:
-                    continue
-                food_words = [w for w in words if len(w) >= 3 and w not in junk_words]
-                if not food_words:
-                    continue
-                    
-                part_lower = part.lower()
-                if part_lower not in ingredients_set:
-                    ingredients.append(part)
-                    ingredients_set.add(part_lower)
-            continue
-        
-        # Cari pola: kata kerja + bahan
-        # Contoh: "Melt butter", "Add flour and sugar", "Peel and core apples"
-        matches = re.finditer(rf'{cooking_verbs}\s+([^,.;]+?)(?:\s+(?:in|into|over|on|to|until|and\s+(?:stir|cook|bring)|,|\.))', step, re.IGNORECASE)
-        for match in matches:
-            ingredient_phrase = match.group(2).strip()
-            # Clean up
-            ingredient_phrase = re.sub(r'\b(the|a|an|some|all|both|remaining)\b\s*', '', ingredient_phrase, flags=re.IGNORECASE)
-            ingredient_phrase = re.sub(r'\s+', ' ', ingredient_phrase).strip()
-            
-            # Filter out junk
-            if len(ingredient_phrase) < 3:
-                continue
-            
-            # Skip single junk words
-            if len(ingredient_phrase.split()) == 1 and ingredient_phrase.lower() in junk_words:
-                continue
-                
-            # Skip phrases that are primarily junk words
-            words = ingredient_phrase.lower().split()
-            if all(w in junk_words for w in words):
-                continue
-            
-            # Must contain at least one food-like word (3+ letters, not a junk word)
-            food_words = [w for w in words if len(w) >= 3 and w not in junk_words]
-            if not food_words:
-                continue
-                
-            ing_lower = ingredient_phrase.lower()
-            if ing_lower not in ingredients_set:
-                ingredients.append(ingredient_phrase)
-                ingredients_set.add(ing_lower)
+    ingredients = extract_ingredients_from_steps(instruction_list)
     
     # 3. AMBIL NUTRITION (dari payload.nutrients yang sudah berbentuk list)
-    nutrients = payload.get("nutrients", [])
     if isinstance(nutrients, list) and nutrients:
         nutrition_list = [str(n).strip() for n in nutrients if str(n).strip()]
-    elif isinstance(payload.get("nutrients_text"), str):
+    elif isinstance(nutrients_text, str):
         # Fallback ke nutrients_text jika masih format lama
-        nutrients_text = payload.get("nutrients_text", "")
         nutrition_list = [n.strip() for n in nutrients_text.split(",") if n.strip()]
     else:
         # Extract from raw text
-        raw_text = payload.get("text", "")
         nutrition_list = extract_nutrition_info(raw_text)
     
     # 4. FORMAT OUTPUT DENGAN STRICT SEPARATION
-    if language == "indonesian":
-        output = [
-            f"# {name}",
-            "---",
-            "## Ingredients"
-        ]
-        
-        if ingredients:
-            for ing in ingredients:
-                output.append(f"- {ing}")
-        else:
-            output.append("- (Bahan tidak terdeteksi)")
-        
-        output.append("## Instruction")
-        if instruction_list:
-            for step in instruction_list:
-                output.append(f"- {step}")
-        else:
-            output.append("- (Langkah tidak tersedia)")
-        
-        output.append("## Nutrition")
-        if nutrition_list:
-            for nut in nutrition_list:
-                output.append(f"- {nut}")
-        else:
-            output.append("- Tidak tersedia")
-    else:
-        output = [
-            f"# {name}",
-            "---",
-            "## Ingredients"
-        ]
-        
-        if ingredients:
-            for ing in ingredients:
-                output.append(f"- {ing}")
-        else:
-            output.append("- (Ingredients not detected)")
-        
-        output.append("## Instruction")
-        if instruction_list:
-            for step in instruction_list:
-                output.append(f"- {step}")
-        else:
-            output.append("- (Steps not available)")
-        
-        output.append("## Nutrition")
-        if nutrition_list:
-            for nut in nutrition_list:
-                output.append(f"- {nut}")
-        else:
-            output.append("- Not available")
-    
+    output = [f"# {name}", "---", "## Ingredients"]
+    output += [f"- {ing}" for ing in ingredients] or [labels["no_ingredients"]]
+    output.append("## Instruction")
+    output += [f"- {step}" for step in instruction_list] or [labels["no_steps"]]
+    output.append("## Nutrition")
+    output += [f"- {nut}" for nut in nutrition_list] or [labels["no_nutrition"]]
+
     return "\n".join(output)
 
+
+def make_formatter(language: str):
+    """Return a payload -> markdown formatter with the language's labels bound once."""
+    labels = RECIPE_OUTPUT_LABELS["indonesian" if language == "indonesian" else "english"]
+    return functools.partial(_format_recipe_output, labels=labels)
+
+
+RECIPE_FORMATTERS = {language: make_formatter(language) for language in RECIPE_OUTPUT_LABELS}
+
     
 def format_with_gemini(raw_text: str, recipe_name: str, user_query: str, ingredients_list=None) -> str:
     # Always detect language from query; prefer Indonesian when detected
     language = detect_language(user_query)
+
+    # Bersihkan teks sekali, dipakai untuk prompt Gemini maupun formatter lokal
+    cleaned_text = clean_garbage_text(raw_text, recipe_name)
+
     if not genai_available:
-        return local_format_to_markdown(raw_text, recipe_name, language)
+        return local_format_to_markdown(raw_text, recipe_name, language, cleaned_text=cleaned_text)
 
     print(f"🔍 GEMINI Processing: {recipe_name}")
-
-    # Bersihkan teks dulu
-    cleaned_text = clean_garbage_text(raw_text, recipe_name)
     
     # Deteksi bahasa (already determined above)
 
@@ -931,45 +1155,74 @@ IMPORTANT: Respond ONLY in {"INDONESIAN" if language == "indonesian" else "ENGLI
             
             if "##" in result_text:
                 print(f"✅ GEMINI Success ({model_name})")
-                # Post-process using our strict local formatter to ensure cleanliness
-                return local_format_to_markdown(raw_text, recipe_name, language, ingredients_list=ingredients_list)
+                # Use Gemini's markdown directly; only strip a wrapping ``` fence if present
+                return CODE_FENCE_PATTERN.sub('', result_text).strip()
         except Exception as e:
             print(f"⚠️ {model_name} failed: {e}")
             continue
     
     # Fallback to local formatter if all Gemini models fail
     print("⚠️ All Gemini models failed, falling back to local formatter")
-    return local_format_to_markdown(raw_text, recipe_name, language, ingredients_list=ingredients_list)
+    return local_format_to_markdown(raw_text, recipe_name, language, ingredients_list=ingredients_list, cleaned_text=cleaned_text)
 
-def llm_extract_structured(raw_text: str, recipe_name: str, target_language: str = 'indonesian') -> dict:
+def parse_extraction_reply(txt: str) -> dict:
+    """Parse an extraction reply into a dict; raises ValueError describing what is wrong.
+
+    Accepts bare JSON or the first JSON object embedded in the reply (e.g. wrapped in ```json
+    fences or prose) - a linear raw_decode scan, no regex backtracking.
+    """
+    try:
+        parsed = json.loads(txt)
+    except ValueError:
+        parsed = None
+        start = txt.find('{')
+        while start != -1:
+            try:
+                parsed, _ = JSON_DECODER.raw_decode(txt, start)
+                break
+            except ValueError:
+                start = txt.find('{', start + 1)
+        if parsed is None:
+            raise ValueError("reply contains no JSON object")
+    if not isinstance(parsed, dict):
+        raise ValueError(f"expected a JSON object, got {type(parsed).__name__}")
+    # 'ing'/'steps' are the short aliases llm_extract_structured also accepts
+    if not any(key in parsed for key in ('ingredients', 'ing', 'instructions', 'steps')):
+        raise ValueError("reply has none of the keys ingredients, instructions")
+    for key in ('ingredients', 'ing', 'instructions', 'steps'):
+        if key in parsed and not isinstance(parsed[key], list):
+            raise ValueError(f"'{key}' must be a list of strings")
+    return parsed
+
+def llm_extract_structured(raw_text: str, recipe_name: str, target_language: str = 'indonesian', fallback: bool = True):
     """Use LLM (Gemini) to extract structured ingredients + instructions and return translations.
 
     Returns dict with keys: ingredients (list), instructions (list), text_id (markdown Indonesian)
-    Falls back to local heuristics if Gemini not available or fails.
+    Falls back to local heuristics if Gemini not available or fails; with fallback=False it returns
+    None instead, so callers (e.g. caches) can tell a real LLM reply from the heuristic result.
     """
-    # Fallback result using local extraction
-    fallback = {}
-    try:
-        fallback_ings = extract_ingredients_from_text(raw_text)
-        fallback_steps = extract_steps(raw_text, recipe_name)
-        fallback_text_id = local_format_to_markdown(raw_text, recipe_name, language='indonesian', ingredients_list=fallback_ings)
-        fallback = {
-            'ingredients': fallback_ings,
-            'instructions': fallback_steps,
-            'text_id': fallback_text_id
-        }
-    except Exception:
-        fallback = {'ingredients': [], 'instructions': [], 'text_id': ''}
+    # Clean once; shared by the Gemini prompt and the local fallback below
+    cleaned = clean_garbage_text(raw_text, recipe_name)
 
-    if not genai_available or genai is None:
-        return fallback
-        fallback = {'ingredients': [], 'instructions': [], 'text_id': ''}
+    # Fallback result using local extraction; built lazily, only on paths that return it
+    def local_fallback() -> dict:
+        try:
+            fallback_ings = extract_ingredients_from_text(raw_text)
+            fallback_steps = extract_steps(raw_text, recipe_name, cleaned_text=cleaned)
+            fallback_text_id = local_format_to_markdown(raw_text, recipe_name, language='indonesian', ingredients_list=fallback_ings, cleaned_text=cleaned)
+            return {
+                'ingredients': fallback_ings,
+                'instructions': fallback_steps,
+                'text_id': fallback_text_id
+            }
+        except Exception:
+            return {'ingredients': [], 'instructions': [], 'text_id': ''}
 
-    if not genai_available:
-        return fallback
+    if not genai_available or genai is None:
+        return local_fallback() if fallback else None
 
     # Build a JSON-only prompt asking Gemini to return structured JSON
-    cleaned = clean_garbage_text(raw_text, recipe_name)
+    # (changing it or the post-processing below? bump LLM_EXTRACT_PROMPT_VERSION)
     prompt = f"""
     You are a helpful assistant that extracts recipe data.
 
@@ -985,97 +1238,116 @@ def llm_extract_structured(raw_text: str, recipe_name: str, target_language: str
     Respond ONLY with valid JSON.
     """
 
-    tried = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-pro"]
-    for model_name in tried:
+    for model_name in LLM_EXTRACT_MODELS:
         try:
             model = genai.GenerativeModel(model_name)
-            resp = model.generate_content(prompt, generation_config={"temperature": 0.0, "max_output_tokens": 1200})
-            txt = resp.text.strip()
-            # try to find JSON substring
-            import json as _json
-            try:
-                parsed = _json.loads(txt)
-                # normalize keys
-                ingredients = parsed.get('ingredients') or parsed.get('ing') or []
-                instructions = parsed.get('instructions') or parsed.get('steps') or []
-                text_id = parsed.get('text_id') or parsed.get('indonesian_markdown') or ''
-
-                # Post-process: normalize ingredient strings
-                def normalize_ingredient(s: str) -> str:
-                    s0 = s.strip()
-                    # remove enclosing punctuation
-                    s0 = re.sub(r'^[^A-Za-z0-9]+|[^A-Za-z0-9]+$', '', s0)
-                    s0 = s0.replace('\t', ' ').replace('\n', ' ').strip()
-                    # common unit normalization
-                    s0 = re.sub(r'\bTablespoons?\b', 'tbsp', s0, flags=re.IGNORECASE)
-                    s0 = re.sub(r'\bTablespoon\b', 'tbsp', s0, flags=re.IGNORECASE)
-                    s0 = re.sub(r'\bTeaspoons?\b', 'tsp', s0, flags=re.IGNORECASE)
-                    s0 = re.sub(r'\bGrams?\b', 'g', s0, flags=re.IGNORECASE)
-                    s0 = re.sub(r'\bKilograms?\b', 'kg', s0, flags=re.IGNORECASE)
-                    s0 = re.sub(r'\bMilliliters?\b', 'ml', s0, flags=re.IGNORECASE)
-                    s0 = re.sub(r'\bCup(s)?\b', 'cup', s0, flags=re.IGNORECASE)
-                    # collapse multiple spaces
-                    s0 = re.sub(r'\s{2,}', ' ', s0)
-                    return s0
-
-                norm_ings = []
-                seen_ing = set()
-                if isinstance(ingredients, list):
-                    for ii in ingredients:
-                        try:
-                            s = str(ii)
-                        except Exception:
-                            continue
-                        n = normalize_ingredient(s)
-                        if len(re.sub(r'[^A-Za-z]+','', n)) < 2:
-                            continue
-                        nl = n.lower()
-                        if nl in seen_ing:
-                            continue
-                        seen_ing.add(nl)
-                        norm_ings.append(n)
-
-                # normalize instructions to short sentences
-                norm_instr = []
-                if isinstance(instructions, list):
-                    for st in instructions:
-                        stt = str(st).strip()
-                        stt = re.sub(r'\s+', ' ', stt)
-                        # remove trailing punctuation gaps
-                        stt = stt.strip()
-                        if len(stt) < 6:
-                            continue
-                        norm_instr.append(stt)
-
-                return {
-                    'ingredients': norm_ings,
-                    'instructions': norm_instr,
-                    'text_id': text_id
-                }
-            except Exception:
-                # If not valid JSON, try to extract JSON-like block
-                import re as _re
-                m = _re.search(r'\{[\s\S]*\}', txt)
-                if m:
+            contents = prompt
+            for attempt in range(LLM_JSON_RETRIES + 1):
+                resp = generate_with_backoff(model, contents, generation_config={"temperature": 0.0, "max_output_tokens": 1200})
+                txt = resp.text.strip()
+                try:
+                    parsed = parse_extraction_reply(txt)
+                    break
+                except ValueError as e:
+                    if attempt == LLM_JSON_RETRIES:
+                        return local_fallback() if fallback else None
+                    # Kirim balik error-nya ke model dan minta perbaikan (biasanya cukup 1x ulang)
+                    time.sleep(1.0 * (attempt + 1))
+                    contents = [
+                        {"role": "user", "parts": [prompt]},
+                        {"role": "model", "parts": [txt]},
+                        {"role": "user", "parts": [f"Your output had error: {e}. Fix it and reply ONLY with valid JSON with keys ingredients, instructions, text_id."]},
+                    ]
+
+            # normalize keys
+            ingredients = parsed.get('ingredients') or parsed.get('ing') or []
+            instructions = parsed.get('instructions') or parsed.get('steps') or []
+            text_id = parsed.get('text_id') or parsed.get('indonesian_markdown') or ''
+
+            # Post-process: normalize ingredient strings
+            def normalize_ingredient(s: str) -> str:
+                s0 = s.strip()
+                # remove enclosing punctuation
+                s0 = re.sub(r'^[^A-Za-z0-9]+|[^A-Za-z0-9]+$', '', s0)
+                s0 = s0.replace('\t', ' ').replace('\n', ' ').strip()
+                # common unit normalization
+                s0 = re.sub(r'\bTablespoons?\b', 'tbsp', s0, flags=re.IGNORECASE)
+                s0 = re.sub(r'\bTablespoon\b', 'tbsp', s0, flags=re.IGNORECASE)
+                s0 = re.sub(r'\bTeaspoons?\b', 'tsp', s0, flags=re.IGNORECASE)
+                s0 = re.sub(r'\bGrams?\b', 'g', s0, flags=re.IGNORECASE)
+                s0 = re.sub(r'\bKilograms?\b', 'kg', s0, flags=re.IGNORECASE)
+                s0 = re.sub(r'\bMilliliters?\b', 'ml', s0, flags=re.IGNORECASE)
+                s0 = re.sub(r'\bCup(s)?\b', 'cup', s0, flags=re.IGNORECASE)
+                # collapse multiple spaces
+                s0 = re.sub(r'\s{2,}', ' ', s0)
+                return s0
+
+            norm_ings = []
+            seen_ing = set()
+            if isinstance(ingredients, list):
+                for ii in ingredients:
                     try:
-                        parsed = _json.loads(m.group(0))
-                        ingredients = parsed.get('ingredients') or []
-                        instructions = parsed.get('instructions') or []
-                        text_id = parsed.get('text_id') or ''
-                        return {'ingredients': ingredients, 'instructions': instructions, 'text_id': text_id}
+                        s = str(ii)
                     except Exception:
-                        pass
-                # else fallback to local
-                return fallback
+                        continue
+                    n = normalize_ingredient(s)
+                    if len(re.sub(r'[^A-Za-z]+','', n)) < 2:
+                        continue
+                    nl = n.lower()
+                    if nl in seen_ing:
+                        continue
+                    seen_ing.add(nl)
+                    norm_ings.append(n)
+
+            # normalize instructions to short sentences
+            norm_instr = []
+            if isinstance(instructions, list):
+                for st in instructions:
+                    stt = str(st).strip()
+                    stt = re.sub(r'\s+', ' ', stt)
+                    # remove trailing punctuation gaps
+                    stt = stt.strip()
+                    if len(stt) < 6:
+                        continue
+                    norm_instr.append(stt)
+
+            return {
+                'ingredients': norm_ings,
+                'instructions': norm_instr,
+                'text_id': text_id
+            }
         except Exception:
             continue
 
-    return fallback
+    return local_fallback() if fallback else None
+
+def llm_extract_structured_batch(texts, names, target_language: str = 'indonesian', workers: int = LLM_BATCH_WORKERS, fallback: bool = True) -> list:
+    """Run llm_extract_structured for many recipes with up to `workers` calls in flight.
+
+    Returns results aligned with the inputs; an entry is None where the call raised
+    (or, with fallback=False, where no LLM reply was used).
+    """
+    texts = list(texts)
+    names = list(names)
+
+    def one(i):
+        try:
+            return llm_extract_structured(texts[i], names[i], target_language=target_language, fallback=fallback)
+        except Exception:
+            return None
+
+    if len(texts) <= 1 or workers <= 1:
+        return [one(i) for i in range(len(texts))]
+    with ThreadPoolExecutor(max_workers=min(workers, len(texts))) as executor:
+        return list(executor.map(one, range(len(texts))))
 
 # ==========================================
 # SEARCH FUNCTION WITH ERROR HANDLING
 # ==========================================
 def search_recipes(query: str, top_k: int = 3):
+    # Deteksi bahasa sekali, dipakai semua cabang di bawah
+    language = detect_language(query)
+    lang_key = "indonesian" if language == "indonesian" else "english"
     try:
         print(f"\n🔎 SEARCH: '{query}'")
 
@@ -1095,74 +1367,24 @@ def search_recipes(query: str, top_k: int = 3):
         # ERROR HANDLING: No Results Found
         # ==========================================
         if not points or len(points) == 0:
-            language = detect_language(query)
-            
-            if language == "indonesian":
-                return [{
-                    "recipe_name": "Tidak Ditemukan",
-                    "text": "## Maaf, Resep Tidak Ditemukan 😔\n\n"
-                           "Resep yang Anda cari tidak ada di database kami.\n\n"
-                           "### 💡 Saran:\n"
-                           "- Coba kata kunci yang berbeda\n"
-                           "- Periksa ejaan resep\n"
-                           "- Cari resep serupa yang mungkin tersedia\n\n"
-                           "**Mau saya rekomendasikan resep populer lainnya?** 🍽️",
-                    "score": 0.0,
-                    "not_found": True
-                }]
-            else:
-                return [{
-                    "recipe_name": "Not Found",
-                    "text": "## Sorry, Recipe Not Found 😔\n\n"
-                           "The recipe you're looking for is not in our database.\n\n"
-                           "### 💡 Suggestions:\n"
-                           "- Try different keywords\n"
-                           "- Check the recipe spelling\n"
-                           "- Search for similar recipes\n\n"
-                           "**Would you like me to recommend other popular recipes?** 🍽️",
-                    "score": 0.0,
-                    "not_found": True
-                }]
+            # salinan dangkal supaya konstanta modul tidak ikut termutasi oleh pemanggil
+            return [dict(NOT_FOUND_RESPONSES[lang_key])]
         
         # ==========================================
         # ERROR HANDLING: Low Similarity Threshold
         # ==========================================
         # Jika score tertinggi terlalu rendah (< 0.3), anggap tidak relevan
         if points[0].score < 0.3:
-            language = detect_language(query)
-            
-            if language == "indonesian":
-                return [{
-                    "recipe_name": "Tidak Relevan",
-                    "text": "## Hmm, Tidak Ada yang Cocok 🤔\n\n"
-                           f"Saya menemukan beberapa resep, tapi tidak ada yang cocok dengan **'{query}'**.\n\n"
-                           "### 💡 Coba:\n"
-                           "- Gunakan nama resep yang lebih spesifik\n"
-                           "- Cari berdasarkan bahan utama\n"
-                           "- Tanyakan kategori makanan (misal: 'kue', 'ayam', 'pasta')\n\n"
-                           "**Atau mau saya carikan resep populer?** 🍳",
-                    "score": points[0].score,
-                    "not_found": True
-                }]
-            else:
-                return [{
-                    "recipe_name": "Not Relevant",
-                    "text": "## Hmm, No Match Found 🤔\n\n"
-                           f"I found some recipes, but none match **'{query}'** well.\n\n"
-                           "### 💡 Try:\n"
-                           "- Use more specific recipe names\n"
-                           "- Search by main ingredient\n"
-                           "- Ask for food categories (e.g., 'cake', 'chicken', 'pasta')\n\n"
-                           "**Or would you like popular recipe suggestions?** 🍳",
-                    "score": points[0].score,
-                    "not_found": True
-                }]
+            resp = dict(LOW_SCORE_RESPONSES[lang_key])
+            resp["text"] = resp["text"].format(query=query)
+            resp["score"] = points[0].score
+            return [resp]
 
         # ==========================================
         # Process Valid Results
         # ==========================================
         hits = []
-        language = detect_language(query)
+        format_payload = RECIPE_FORMATTERS[language]
 
         for i, point in enumerate(points):
             payload = point.payload or {}
@@ -1170,7 +1392,7 @@ def search_recipes(query: str, top_k: int = 3):
             score = point.score
             
             # GUNAKAN FORMAT BARU YANG KONSISTEN
-            formatted_text = format_recipe_output(payload, language)
+            formatted_text = format_payload(payload)
 
             hits.append({
                 "recipe_name": recipe_name,
@@ -1183,8 +1405,6 @@ def search_recipes(query: str, top_k: int = 3):
 
     except Exception as e:
         print(f"🚨 ERROR SEARCH: {e}")
-        language = detect_language(query)
-        
         error_msg = {
             "recipe_name": "Error" if language == "english" else "Kesalahan",
             "text": f"## System Error ⚠️\n\n{str(e)}\n\nSilakan coba lagi atau hubungi admin." 
@@ -3,70 +3,94 @@
 Usage:
   PYTHONPATH=. python3 backend/scan_and_prepare_updates.py [--limit N] [--apply]
 
-Default: dry-run (no writes). Add `--apply` to perform updates (will attempt per-point update).
+Default: dry-run (no writes). Add `--apply` to perform updates (written in batches as candidates stream in).
 """
-from rag_core import get_client, COLLECTION_NAME, extract_ingredients_from_text, llm_extract_structured, NUTRITION_HINTS, TIME_TEMPERATURE_PATTERN
+from rag_core import get_client, COLLECTION_NAME, extract_ingredients_from_text, llm_extract_structured, NUTRITION_HINTS, TIME_TEMPERATURE_PATTERN, compile_linear, set_payload_batch, retrieve_payloads
+from qdrant_client.models import PayloadSelectorInclude
+import os
 import re
 import json
 import argparse
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+# orjson (optional) - faster encoder for the unicode-heavy preview records; falls back to `json`
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+
+def _pattern_source(pattern) -> str:
+    # shared patterns may carry a leading inline (?i); it is re-applied once to the fused pattern
+    src = pattern.pattern
+    return src[len('(?i)'):] if src.startswith('(?i)') else src
+
+
+# One pass instead of three: leading cooking verb OR nutrition token OR time/temperature token
+NOISY_PATTERN = compile_linear(
+    r'(?i)^(?:add|stir|mix|fold|press|place|roll|peel|slice|melt|pour|set|make|brush|bake|preheat)\b'
+    f'|(?:{_pattern_source(NUTRITION_HINTS)})'
+    f'|(?:{_pattern_source(TIME_TEMPERATURE_PATTERN)})'
+)
+NON_ALPHA_PATTERN = re.compile(r'[^A-Za-z]')
+
+PREVIEW_PATH = 'backend/scan_update_preview.json'
+APPLY_BATCH = 128
+SCROLL_PAGE = 1024
+LLM_WORKERS = 8
+
+
+def dump_preview_record(record) -> bytes:
+    """Encode one preview record as indented UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+@functools.lru_cache(maxsize=8192)
 def is_noisy_ingredient(ing: str) -> bool:
-    if not ing or len(ing.strip()) < 2:
+    # cached: the same ingredient strings ("salt", "1 cup sugar", ...) recur across many points
+    if not ing:
         return True
-    # starts with common verb -> noisy
-    if re.match(r'^(add|stir|mix|fold|press|place|roll|peel|slice|melt|pour|press|set|make|brush|bake|preheat)\b', ing.strip(), re.IGNORECASE):
+    ing_stripped = ing.strip()
+    if len(ing_stripped) < 2:
         return True
-    # contains nutrition tokens
-    if NUTRITION_HINTS.search(ing) or TIME_TEMPERATURE_PATTERN.search(ing):
+    # starts with common verb, or contains nutrition / time-temperature tokens -> noisy
+    if NOISY_PATTERN.search(ing_stripped):
         return True
     # single short tokens like 'core', 'some', 'way' are likely noise
-    if len(ing.split()) == 1 and len(re.sub(r'[^A-Za-z]','', ing)) <= 4:
+    if len(ing.split()) == 1 and len(NON_ALPHA_PATTERN.sub('', ing)) <= 4:
         return True
     return False
 
 
 def scan_collection(limit=None):
+    """Yield noisy/missing-ingredient candidates one by one instead of collecting them all."""
     client = get_client()
-    offset = 0
-    batch = 100
-    found = []
+    next_offset = None
+    found = 0
 
     while True:
-        resp = client.scroll(collection_name=COLLECTION_NAME, limit=batch, offset=offset, with_payload=True)
-        points = None
-        # support different qdrant client shapes
-        if hasattr(resp, 'points'):
-            points = resp.points
-        elif isinstance(resp, dict) and 'result' in resp:
-            points = resp['result']
-        elif isinstance(resp, dict) and 'points' in resp:
-            points = resp['points']
-        else:
-            points = resp
+        # cursor pagination: Qdrant hands back the offset of the next page (None when done);
+        # only the fields needed to judge a row are fetched, no vectors and no large `text`
+        points, next_offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            limit=SCROLL_PAGE,
+            offset=next_offset,
+            with_payload=PayloadSelectorInclude(include=['ingredients', 'recipe_name', 'title']),
+            with_vectors=False
+        )
 
         if not points:
             break
 
-        for p in points:
-            # points may be returned as objects, dicts, or nested lists depending on client version
-            items = [p]
-            if isinstance(p, (list, tuple)):
-                items = list(p)
-            for item in items:
-                pid = None
-                payload = {}
-                if hasattr(item, 'id'):
-                    pid = item.id
-                    payload = item.payload if hasattr(item, 'payload') else {}
-                elif isinstance(item, dict):
-                    pid = item.get('id')
-                    payload = item.get('payload') or {}
-                else:
-                    # unknown shape, skip
-                    continue
+        page_candidates = []
+        for item in points:
+            pid = item.id
+            payload = item.payload or {}
             ingredients = payload.get('ingredients')
-            text = payload.get('text','')
             recipe_name = payload.get('recipe_name') or payload.get('title') or '<no-name>'
 
             # normalize ingredients list to python list of strings
@@ -77,105 +101,164 @@ def scan_collection(limit=None):
                 else:
                     ings = [ln.strip() for ln in str(ingredients).split('\n') if ln.strip()]
 
-            noisy = False
-            # If there are ingredients but many are noisy, mark for update
+            # If there are ingredients but many are noisy, mark for update;
+            # if no ingredients, attempt extraction and update
+            noisy = True
             if ings:
-                noisy_count = sum(1 for it in ings if is_noisy_ingredient(it))
-                if noisy_count >= max(1, len(ings)//2):
-                    noisy = True
-            else:
-                # if no ingredients, attempt extraction and update
-                noisy = True
-
-                if noisy:
-                    found.append({'id': pid, 'recipe_name': recipe_name, 'payload_ings': ings, 'text': text})
-
-            if limit and len(found) >= limit:
-                return found
-
-        # advance
-        offset += batch
-
-    return found
-
-
-def prepare_updates(candidates, use_llm=False):
-    prepared = []
-    for c in candidates:
-        text = c['text']
-        name = c['recipe_name']
-        if use_llm:
-            try:
-                res = llm_extract_structured(text, name, target_language='indonesian')
-                new_ings = res.get('ingredients', [])
-                new_instr = res.get('instructions', [])
-            except Exception:
-                new_ings = extract_ingredients_from_text(text)
-                new_instr = []
-        else:
-            new_ings = extract_ingredients_from_text(text)
-            new_instr = []
-
-        prepared.append({'id': c['id'], 'recipe_name': name, 'new_ingredients': new_ings, 'new_instructions': new_instr})
+                threshold = max(1, len(ings) // 2)
+                noisy_count = 0
+                noisy = False
+                for it in ings:
+                    if is_noisy_ingredient(it):
+                        noisy_count += 1
+                        if noisy_count >= threshold:
+                            noisy = True
+                            break
+
+            if noisy:
+                page_candidates.append({'id': pid, 'recipe_name': recipe_name, 'payload_ings': ings})
+                if limit and found + len(page_candidates) >= limit:
+                    break
+
+        # one batched retrieve of `text` for just this page's candidates
+        texts = retrieve_payloads([c['id'] for c in page_candidates], ['text'])
+        for c in page_candidates:
+            c['text'] = texts.get(c['id'], {}).get('text', '')
+            found += 1
+            yield c
+
+        if (limit and found >= limit) or next_offset is None:
+            break
+
+
+def prepare_one(c, use_llm=False) -> dict:
+    text = c['text']
+    name = c['recipe_name']
+    res = None
+    if use_llm:
+        try:
+            # fallback=False: None means no LLM reply was used (rate limited, every model failed, bad JSON)
+            res = llm_extract_structured(text, name, target_language='indonesian', fallback=False)
+        except Exception:
+            pass
+    if res is not None:
+        new_ings = res.get('ingredients', [])
+        new_instr = res.get('instructions', [])
+    else:
+        new_ings = extract_ingredients_from_text(text)
+        new_instr = []
+
+    prepared = {'id': c['id'], 'recipe_name': name, 'new_ingredients': new_ings, 'new_instructions': new_instr}
+    if use_llm:
+        # flagged so a rate-limited run shows up in the preview and the summary
+        prepared['llm_fallback'] = res is None
     return prepared
 
 
+def prepare_updates(candidates, use_llm=False, workers=LLM_WORKERS):
+    """Lazily map candidates to prepared updates (consumes `candidates` as a stream).
+
+    With use_llm, extraction calls are network-bound, so up to `workers` run concurrently;
+    results are still yielded in candidate order and at most 2*workers are held in flight.
+    """
+    if not use_llm or workers <= 1:
+        for c in candidates:
+            yield prepare_one(c, use_llm=use_llm)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for c in candidates:
+            in_flight.append(executor.submit(prepare_one, c, True))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def apply_updates(prepared) -> tuple:
+    """Write the prepared ingredient/instruction patches to Qdrant in one batched request.
+
+    Returns (written, failed) point counts.
+    """
+    updates = []
+    for p in prepared:
+        payload = {}
+        if p['new_ingredients']:
+            payload['ingredients'] = p['new_ingredients']
+        if p['new_instructions']:
+            payload['instructions'] = p['new_instructions']
+        if payload:
+            updates.append((p['id'], payload))
+    try:
+        return set_payload_batch(updates), 0
+    except Exception as e:
+        print(f'Failed to update {len(updates)} point(s): {e}')
+        return 0, len(updates)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--limit', type=int, default=200, help='Max candidates to inspect')
     parser.add_argument('--apply', action='store_true', help='Apply updates to Qdrant')
     parser.add_argument('--use-llm', action='store_true', help='Use LLM for extraction when available')
+    parser.add_argument('--workers', type=int, default=LLM_WORKERS, help='Concurrent LLM extraction calls (with --use-llm)')
     args = parser.parse_args()
 
     print('Scanning collection for noisy ingredient payloads...')
     candidates = scan_collection(limit=args.limit)
-    print(f'Found {len(candidates)} candidate(s) that look noisy or missing ingredients.')
 
-    if not candidates:
-        return
+    # Stream: each candidate is prepared, written to the preview (still one JSON array) and,
+    # with --apply, queued for a batched write, so memory stays bounded by APPLY_BATCH.
+    count = 0
+    updated = 0
+    failed = 0
+    fallbacks = 0
+    pending = []
+    # written to a temp file and swapped in at the end, so a crash never leaves a truncated preview
+    tmp_path = PREVIEW_PATH + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'[\n')
+        for p in prepare_updates(candidates, use_llm=args.use_llm, workers=args.workers):
+            if count:
+                f.write(b',\n')
+            f.write(dump_preview_record(p))
+            count += 1
+            if p.get('llm_fallback'):
+                fallbacks += 1
 
-    prepared = prepare_updates(candidates, use_llm=args.use_llm)
+            # show summary
+            if count <= 50:
+                print('\n---')
+                print(f"ID: {p['id']} | {p['recipe_name']}")
+                print('New Ingredients:')
+                for ni in p['new_ingredients'][:20]:
+                    print(' -', ni)
+                if not p['new_ingredients']:
+                    print(' - (none found)')
 
-    # show summary
-    for p in prepared[:50]:
-        print('\n---')
-        print(f"ID: {p['id']} | {p['recipe_name']}")
-        print('New Ingredients:')
-        for ni in p['new_ingredients'][:20]:
-            print(' -', ni)
-        if not p['new_ingredients']:
-            print(' - (none found)')
+            if args.apply:
+                pending.append(p)
+                if len(pending) >= APPLY_BATCH:
+                    written, errors = apply_updates(pending)
+                    updated += written
+                    failed += errors
+                    pending.clear()
+        f.write(b'\n]\n')
+    os.replace(tmp_path, PREVIEW_PATH)
 
-    # write to file for review
-    with open('backend/scan_update_preview.json', 'w') as f:
-        json.dump(prepared, f, ensure_ascii=False, indent=2)
+    if args.apply and pending:
+        written, errors = apply_updates(pending)
+        updated += written
+        failed += errors
 
-    print('\nPreview saved to backend/scan_update_preview.json')
+    print(f'\nFound {count} candidate(s) that look noisy or missing ingredients.')
+    print(f'Preview saved to {PREVIEW_PATH}')
+    if args.use_llm:
+        print(f'LLM fallbacks (heuristic ingredients used): {fallbacks}')
 
     if args.apply:
-        client = get_client()
-        updated = 0
-        for p in prepared:
-            try:
-                payload = {}
-                if p['new_ingredients']:
-                    payload['ingredients'] = p['new_ingredients']
-                if p['new_instructions']:
-                    payload['instructions'] = p['new_instructions']
-                if not payload:
-                    continue
-                # Attempt to update point payload
-                try:
-                    client.update_point(collection_name=COLLECTION_NAME, point_id=p['id'], payload=payload)
-                    updated += 1
-                except Exception:
-                    # fallback: upsert with empty vector (safe only if collection allows)
-                    client.upsert(collection_name=COLLECTION_NAME, points=[{'id': p['id'], 'payload': payload}])
-                    updated += 1
-            except Exception as e:
-                print('Failed to update', p['id'], e)
-
-        print(f'Applied updates: {updated}')
+        print(f'Applied updates: {updated} (failed: {failed})')
 
 
 if __name__ == '__main__':
@@ -10,12 +10,25 @@ Usage:
     python backend/simple_evaluate.py
 """
 
+import re
 import json
-import requests
+import httpx
 import pandas as pd
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 API_URL = "http://localhost:8000/ask_raw"
+MAX_WORKERS = 8
+# Word tokens used for set-based term matching in the generation metrics
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# One pooled client shared by all worker threads; over https the concurrent calls
+# multiplex on a single HTTP/2 connection (httpx[http2] comes with qdrant-client)
+_client = httpx.Client(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=2 * MAX_WORKERS, max_keepalive_connections=MAX_WORKERS),
+)
 
 def load_test_queries(filepath="backend/test_queries.json"):
     """Load test queries from JSON file."""
@@ -25,11 +38,7 @@ def load_test_queries(filepath="backend/test_queries.json"):
 def get_rag_response_via_api(query: str, top_k: int = 3):
     """Get response from RAG system via HTTP API."""
     try:
-        response = requests.post(
-            API_URL,
-            json={"question": query, "top_k": top_k},
-            timeout=30
-        )
+        response = _client.post(API_URL, json={"question": query, "top_k": top_k})
         response.raise_for_status()
         results = response.json()
         
@@ -115,6 +124,10 @@ def calculate_retrieval_metrics(test_queries, responses):
         "avg_similarity_top3": avg_top3_score
     }
 
+def tokenize(text: str) -> set:
+    """Lowercased word-token set of `text`."""
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
 def calculate_generation_metrics(test_queries, responses):
     """Calculate generation-focused metrics."""
     print("\n" + "=" * 60)
@@ -134,41 +147,37 @@ def calculate_generation_metrics(test_queries, responses):
         answer = response.get("answer", "")
         contexts = response.get("contexts", [])
         
+        # Tokenize once per response; every check below is a set intersection
+        ctx_tokens = tokenize(" ".join(contexts)) if contexts else set()
+        answer_tokens = tokenize(answer) if answer else set()
+        
         # 1. Context Recall: How much ground truth is captured in contexts?
         if ground_truth and contexts:
-            gt_terms = set(ground_truth.lower().split())
-            gt_terms = {t for t in gt_terms if len(t) > 3}
-            
-            all_contexts = " ".join(contexts).lower()
-            found = sum(1 for term in gt_terms if term in all_contexts)
+            gt_terms = {t for t in tokenize(ground_truth) if len(t) > 3}
+            found = len(gt_terms & ctx_tokens)
             context_recall = found / len(gt_terms) if gt_terms else 0
             context_recall_sum += context_recall
         
         # 2. Faithfulness: Answer doesn't hallucinate (content in context)
         if answer and contexts:
-            answer_terms = set(answer.lower().split())
-            answer_terms = {t for t in answer_terms if len(t) > 4}
-            
-            all_contexts = " ".join(contexts).lower()
-            found = sum(1 for term in answer_terms if term in all_contexts)
+            answer_terms = {t for t in answer_tokens if len(t) > 4}
+            found = len(answer_terms & ctx_tokens)
             faithfulness = found / len(answer_terms) if answer_terms else 0
             faithfulness_sum += faithfulness
         
         # 3. Answer Relevancy: Answer addresses the question
         if answer and question:
-            q_terms = set(question.lower().split())
-            q_terms = {t for t in q_terms if len(t) > 3}
-            
-            answer_lower = answer.lower()
-            matches = sum(1 for term in q_terms if term in answer_lower)
+            q_terms = {t for t in tokenize(question) if len(t) > 3}
+            matches = len(q_terms & answer_tokens)
             relevancy = matches / len(q_terms) if q_terms else 0
             answer_relevancy_sum += relevancy
         
-        # 4. Completeness: Check if key ingredients mentioned
-        if key_ingredients and answer:
-            answer_lower = answer.lower()
-            found_ing = sum(1 for ing in key_ingredients if ing.lower() in answer_lower)
-            completeness = found_ing / len(key_ingredients) if key_ingredients else 0
+        # 4. Completeness: Check if key ingredients mentioned (every word of a multi-word ingredient)
+        # (ingredients with no word tokens can't be matched, so they are left out of the count)
+        ing_tokens = [t for t in (tokenize(ing) for ing in key_ingredients) if t]
+        if ing_tokens and answer:
+            found_ing = sum(1 for t in ing_tokens if t <= answer_tokens)
+            completeness = found_ing / len(ing_tokens)
             completeness_sum += completeness
     
     # Calculate averages
@@ -200,14 +209,12 @@ def run_evaluation():
     test_queries = load_test_queries()
     print(f"\n📝 Loaded {len(test_queries)} test queries")
     
-    # Get responses
+    # Get responses (queries are I/O-bound, so run them concurrently; map keeps input order)
     print("\n🔄 Getting RAG responses...")
-    responses = []
-    for i, test in enumerate(test_queries, 1):
-        query = test["query"]
-        print(f"  [{i}/{len(test_queries)}] {query}")
-        response = get_rag_response_via_api(query, top_k=3)
-        responses.append(response)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        responses = list(executor.map(lambda t: get_rag_response_via_api(t["query"], top_k=3), test_queries))
+    for i, (test, response) in enumerate(zip(test_queries, responses), 1):
+        print(f"  [{i}/{len(test_queries)}] {test['query']}")
         if response["recipe_names"]:
             print(f"      ✓ Top result: {response['recipe_names'][0]} (score: {response['scores'][0]:.4f})")
         else:
@@ -7,37 +7,117 @@ rag_core.llm_extract_structured and set the payload.
 Usage: PYTHONPATH=. python3 backend/update_by_names_sample.py --count 10
 """
 import argparse
+import hashlib
+import logging
+import os
+import shelve
 import time
 import json
+import numpy as np
 from backend import rag_core
+from qdrant_client.models import (
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+)
 
-def update_sample(count=10, sleep_between=0.3):
+log = logging.getLogger(__name__)
+# Progress is logged every LOG_EVERY names; per-name detail only at DEBUG
+LOG_EVERY = 50
+
+# Persistent name -> embedding cache, so restarts and repeated runs skip the encoder
+EMBED_CACHE_PATH = 'backend/.cache/name_embeds'
+
+# --quantize choices -> collection quantization config (quantized vectors pinned in RAM)
+QUANTIZATION_CONFIGS = {
+    'scalar': lambda: ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)),
+    'binary': lambda: BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True)),
+}
+
+
+def embed_names(names):
+    """Embed recipe names, reusing vectors cached on disk from earlier runs.
+
+    Keys are sha1(model + name); vectors are stored as float16 bytes (half the size of float32).
+    Only cache misses go through `rag_core.embed_texts`, in one batch.
+    Returns a float16 matrix with one row per name.
+    """
+    os.makedirs(os.path.dirname(EMBED_CACHE_PATH), exist_ok=True)
+    keys = [hashlib.sha1(f"{rag_core.EMBED_MODEL}\0{name}".encode('utf-8')).hexdigest() for name in names]
+    with shelve.open(EMBED_CACHE_PATH) as cache:
+        missing = [i for i, key in enumerate(keys) if key not in cache]
+        if missing:
+            fresh = rag_core.embed_texts([names[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                cache[keys[i]] = np.asarray(vec, dtype=np.float16).tobytes()
+        log.info("Embedding cache: %d hit(s), %d miss(es)", len(names) - len(missing), len(missing))
+        if not keys:
+            return np.empty((0, 0), dtype=np.float16)
+        return np.stack([np.frombuffer(cache[key], dtype=np.float16) for key in keys])
+
+
+def update_sample(count=10, sleep_between=0.3, batch_size=128, quantize='none'):
     client = rag_core.get_client()
+    if quantize in QUANTIZATION_CONFIGS:
+        client.update_collection(
+            collection_name=rag_core.COLLECTION_NAME,
+            quantization_config=QUANTIZATION_CONFIGS[quantize]()
+        )
+        log.info("Enabled %s quantization on %s", quantize, rag_core.COLLECTION_NAME)
     with open('backend/data/recipe_new.json','r',encoding='utf-8') as f:
         data = json.load(f)
 
-    updated = 0
-    processed = 0
+    names = []
     for item in data:
-        if processed >= count:
+        if len(names) >= count:
             break
         if not isinstance(item, dict):
             continue
         name = item.get('name')
-        if not name:
-            continue
+        if name:
+            names.append(name)
+
+    # One batched encoder pass (cache misses only) + one batched Qdrant query instead of a round-trip per name
+    vecs = embed_names(names)
+    results = []
+    if len(vecs):
+        # the float16 matrix is widened row by row; Qdrant takes plain float lists
+        results = client.query_batch_points(
+            collection_name=rag_core.COLLECTION_NAME,
+            requests=[QueryRequest(query=vec.tolist(), limit=1, with_payload=True) for vec in vecs]
+        )
+
+    updated = 0
+    processed = 0
+    pending = []
+
+    def flush():
+        nonlocal updated
+        if not pending:
+            return
+        try:
+            updated += rag_core.set_payload_batch(pending)
+            log.debug("Wrote payloads for %d point(s)", len(pending))
+        except Exception as e:
+            log.warning("Failed to set payload for %s: %s", [pid for pid, _ in pending], e)
+        pending.clear()
+
+    for name, res in zip(names, results):
         processed += 1
-        print(f"Processing sample [{processed}/{count}]: {name}")
-        vec = rag_core.embed_text(name)
-        res = client.query_points(collection_name=rag_core.COLLECTION_NAME, query=vec, limit=1, with_payload=True)
+        if processed % LOG_EVERY == 0:
+            log.info("processed=%d/%d updated=%d", processed, len(names), updated)
+        log.debug("Processing sample [%d/%d]: %s", processed, len(names), name)
         if not res.points:
-            print("  No point found for this name")
+            log.debug("No point found for %s", name)
             continue
         pt = res.points[0]
         pid = getattr(pt, 'id', None)
         payload = pt.payload or {}
         if payload.get('ingredients'):
-            print("  Already has ingredients, skipping")
+            log.debug("Point %s already has ingredients, skipping", pid)
             continue
 
         # extract using LLM helper
@@ -46,26 +126,31 @@ def update_sample(count=10, sleep_between=0.3):
         new_instr = extracted.get('instructions') or []
         text_id = extracted.get('text_id') or None
 
+        # send only the changed keys (set_payload merges), not the whole payload with its text
+        diff = {}
         if new_ings:
-            payload['ingredients'] = new_ings
+            diff['ingredients'] = new_ings
         if new_instr:
-            payload['instructions'] = new_instr
+            diff['instructions'] = new_instr
         if text_id:
-            payload['text_id'] = text_id
-
-        try:
-            client.set_payload(collection_name=rag_core.COLLECTION_NAME, payload=payload, points=[pid])
-            updated += 1
-            print(f"  Updated point {pid}: +{len(new_ings)} ingredients")
-        except Exception as e:
-            print(f"  Failed to set payload for {pid}: {e}")
+            diff['text_id'] = text_id
+        if diff:
+            pending.append((pid, diff))
+            log.debug("Queued point %s: +%d ingredients", pid, len(new_ings))
+            if len(pending) >= batch_size:
+                flush()
 
         time.sleep(sleep_between)
 
-    print(f"Sample update done. Updated {updated} of {processed} processed.")
+    flush()
+    log.info("Sample update done. Updated %d of %d processed.", updated, processed)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--quantize', choices=['none', 'scalar', 'binary'], default='none',
+                        help='Enable scalar (int8) or binary quantization on the collection before sampling')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every name (DEBUG)')
     args = parser.parse_args()
-    update_sample(count=args.count)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    update_sample(count=args.count, quantize=args.quantize)
@@ -8,109 +8,168 @@ This script will iterate over points in the collection, and for points missing
 `payload['ingredients']` or where the list looks too short/noisy, it will call
 `rag_core.llm_extract_structured` (if available) and `rag_core.extract_ingredients_from_text` as fallback,
 normalize results and upsert updated payloads back into Qdrant.
+
+Only points without ingredients, without an `ingredients_quality` score, or with a score
+below `rag_core.INGREDIENTS_QUALITY_MIN` are scrolled (filtered server-side). Points that are
+scored on the way are given their score, so later runs skip them.
 """
 import argparse
+import logging
 from backend import rag_core
-from qdrant_client.models import PointStruct
+from qdrant_client.models import (
+    PointStruct,
+    PayloadSelectorInclude,
+    PayloadSchemaType,
+    Filter,
+    FieldCondition,
+    IsEmptyCondition,
+    PayloadField,
+    Range,
+)
+
+log = logging.getLogger(__name__)
+# Progress is logged every LOG_EVERY points; per-point detail only at DEBUG
+LOG_EVERY = 50
+
+# Server-side candidate filter: ingredients missing/empty, never scored, or scored as noisy
+CANDIDATE_FILTER = Filter(should=[
+    IsEmptyCondition(is_empty=PayloadField(key='ingredients')),
+    IsEmptyCondition(is_empty=PayloadField(key=rag_core.INGREDIENTS_QUALITY_FIELD)),
+    FieldCondition(key=rag_core.INGREDIENTS_QUALITY_FIELD, range=Range(lt=rag_core.INGREDIENTS_QUALITY_MIN)),
+])
 
 
 def looks_noisy(ings: list) -> bool:
-    if not ings:
-        return True
     # if most items are single-char or numeric, consider noisy
-    good = 0
-    for i in ings:
-        s = str(i).strip()
-        if len(s) >= 3 and any(c.isalpha() for c in s):
-            good += 1
-    return (good / max(1, len(ings))) < 0.5
+    return rag_core.ingredients_quality(ings) < rag_core.INGREDIENTS_QUALITY_MIN
 
 
-def main(dry_run=True, batch=256):
-    client = rag_core.get_client()
-    total_updated = 0
-    print(f"Scanning collection: {rag_core.COLLECTION_NAME}")
+def needs_update(payload: dict) -> bool:
+    ings = payload.get('ingredients')
+    if not ings:
+        return True
+    try:
+        return looks_noisy(ings)
+    except Exception:
+        return True
+
 
-    # Use scroll API to iterate; handle different shapes returned by client.scroll
-    scroll_res = client.scroll(collection_name=rag_core.COLLECTION_NAME, with_payload=True, limit=500)
-    items = []
-    # scroll_res can be a list of dicts or a generator; normalize to flat list of point dicts
+def ensure_quality_index(client):
+    """Create the integer payload index backing the `ingredients_quality` range filter (idempotent)."""
     try:
-        for entry in scroll_res:
-            if isinstance(entry, dict) and 'result' in entry:
-                # some client versions wrap results
-                items.extend(entry.get('result') or [])
+        client.create_payload_index(
+            collection_name=rag_core.COLLECTION_NAME,
+            field_name=rag_core.INGREDIENTS_QUALITY_FIELD,
+            field_schema=PayloadSchemaType.INTEGER
+        )
+    except Exception as e:
+        log.warning("Could not create payload index on %s: %s", rag_core.INGREDIENTS_QUALITY_FIELD, e)
+
+
+def iter_candidates(client, page_size=500, backfill=False):
+    """Yield (point_id, payload) for points whose ingredients are missing or noisy.
+
+    Only points matching CANDIDATE_FILTER are scrolled, with just `ingredients`/`recipe_name`
+    in the payload (no vectors); the large `text` field is fetched afterwards, in one request
+    per page, for candidates only. With `backfill`, points that turn out fine are given their
+    `ingredients_quality` score so the filter excludes them next time.
+    """
+    next_offset = None
+    while True:
+        points, next_offset = client.scroll(
+            collection_name=rag_core.COLLECTION_NAME,
+            scroll_filter=CANDIDATE_FILTER,
+            limit=page_size,
+            offset=next_offset,
+            with_payload=PayloadSelectorInclude(include=['ingredients', 'recipe_name']),
+            with_vectors=False
+        )
+        todo = []
+        scored = []
+        for p in points:
+            if p.id is None:
+                continue
+            payload = p.payload or {}
+            if needs_update(payload):
+                todo.append((p.id, payload))
             else:
-                items.append(entry)
-    except Exception:
-        # fallback: try to convert to list directly
-        try:
-            items = list(scroll_res)
-        except Exception:
-            items = []
-
-    updates = []
-
-    for p in items:
-        # p may be a dict with keys 'id','payload' or an object; handle both
-        if isinstance(p, dict):
-            payload = p.get('payload') or {}
-            pid = p.get('id')
-        else:
-            # try attribute access
-            payload = getattr(p, 'payload', None) or {}
-            pid = getattr(p, 'id', None)
-        # skip invalid entries
-        if not pid:
-            continue
-        ings = payload.get('ingredients')
-
-        need = False
-        if not ings:
-            need = True
-        else:
+                scored.append((p.id, {rag_core.INGREDIENTS_QUALITY_FIELD: rag_core.ingredients_quality(payload['ingredients'])}))
+        if backfill and scored:
             try:
-                if looks_noisy(ings):
-                    need = True
-            except Exception:
-                need = True
+                rag_core.set_payload_batch(scored)
+            except Exception as e:
+                log.warning("Failed to store quality scores for %d points: %s", len(scored), e)
+        texts = rag_core.retrieve_payloads([pid for pid, _ in todo], ['text'])
+        for pid, payload in todo:
+            payload['text'] = texts.get(pid, {}).get('text', '')
+            yield pid, payload
+        if next_offset is None:
+            break
 
-        if not need:
-            continue
 
-        print(f"Re-extracting for point {pid} (recipe={payload.get('recipe_name')})")
+def main(dry_run=True, batch=256):
+    client = rag_core.get_client()
+    total_updated = 0
+    processed = 0
+    log.info("Scanning collection: %s", rag_core.COLLECTION_NAME)
+    if not dry_run:
+        ensure_quality_index(client)
+
+    pending = []
+
+    def flush():
+        nonlocal total_updated
+        if not pending:
+            return
+        # one batched request per `batch` points instead of a set_payload round-trip each
+        try:
+            total_updated += rag_core.set_payload_batch(pending)
+        except Exception as e:
+            log.warning("Upsert/set_payload failed for %d points: %s", len(pending), e)
+        pending.clear()
+
+    for pid, payload in iter_candidates(client, backfill=not dry_run):
+        processed += 1
+        if processed % LOG_EVERY == 0:
+            log.info("processed=%d updated=%d", processed, total_updated)
+        log.debug("Re-extracting for point %s (recipe=%s)", pid, payload.get('recipe_name'))
         try:
             res = rag_core.llm_extract_structured(payload.get('text',''), payload.get('recipe_name',''))
             new_ings = res.get('ingredients') or []
             new_instr = res.get('instructions') or []
             text_id = res.get('text_id') or None
+            # only the changed keys are sent; set_payload merges them into the stored payload,
+            # so the large `text` is not re-uploaded and other fields are left untouched
+            # (set_payload_batch scores new ingredients itself)
+            diff = {}
             if new_ings:
-                payload['ingredients'] = new_ings
+                diff['ingredients'] = new_ings
+            else:
+                # re-scored even when unchanged, so a still-noisy point stays in the filter
+                diff[rag_core.INGREDIENTS_QUALITY_FIELD] = rag_core.ingredients_quality(payload.get('ingredients'))
             if new_instr:
-                payload['instructions'] = new_instr
+                diff['instructions'] = new_instr
             if text_id:
-                payload['text_id'] = text_id
+                diff['text_id'] = text_id
 
             if not dry_run:
-                # update payload in-place using set_payload (no vector required)
-                try:
-                    client.set_payload(collection_name=rag_core.COLLECTION_NAME, payload=payload, points=[pid])
-                    total_updated += 1
-                    if total_updated % batch == 0:
-                        print(f"  Updated {total_updated} points so far")
-                except Exception as e:
-                    print(f"  Upsert/set_payload failed for {pid}: {e}")
+                pending.append((pid, diff))
+                if len(pending) >= batch:
+                    flush()
             else:
-                print(f"  [dry-run] would update: {len(new_ings)} ingredients, {len(new_instr)} instructions")
+                log.debug("[dry-run] would update %s: %d ingredients, %d instructions", pid, len(new_ings), len(new_instr))
         except Exception as e:
-            print(f"  Failed to extract: {e}")
+            log.warning("Failed to extract for point %s: %s", pid, e)
 
-    print(f"Done. Total updated: {total_updated} (dry_run={dry_run})")
+    flush()
+    log.info("Done. Processed: %d, total updated: %d (dry_run=%s)", processed, total_updated, dry_run)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--no-dry-run', dest='dry', action='store_false', help='Actually upsert changes')
     parser.add_argument('--batch', type=int, default=256)
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every point (DEBUG)')
     args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
     main(dry_run=args.dry, batch=args.batch)
@@ -2,93 +2,295 @@
 
 Usage:
   PYTHONPATH=. python3 backend/update_single_recipe_by_name.py --name "Old Fashioned Cocktail"
+  PYTHONPATH=. python3 backend/update_single_recipe_by_name.py --names-file names.txt
 Optional flags: --use-llm to prefer LLM extraction
 """
 import argparse
-from rag_core import get_client, COLLECTION_NAME, llm_extract_structured, extract_ingredients_from_text, extract_steps
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import rag_core
+from rag_core import get_client, COLLECTION_NAME, extract_ingredients_from_text, extract_steps, LLM_EXTRACT_MODELS, LLM_EXTRACT_PROMPT_VERSION, llm_extract_structured_batch, set_payload_batch, retrieve_payloads
+from extraction_cache import ExtractionCache, make_key, DEFAULT_CACHE_DIR
+from qdrant_client.models import Filter, FieldCondition, MatchAny, IsEmptyCondition, PayloadField, PayloadSchemaType, PayloadSelectorInclude
 
+log = logging.getLogger(__name__)
 
-def find_and_update(name: str, use_llm: bool = True):
-    client = get_client()
-    offset = 0
-    batch = 100
-    found_any = False
+# Lowercased copy of recipe_name written at ingest; keyword-indexed so lookups are one filtered probe
+NAME_FIELD = 'recipe_name_lc'
+FIND_LIMIT = 10
+SCAN_PAGE = 256
+# Scrolls carry only the name fields; `text` is retrieved afterwards for matched points only
+MATCH_PAYLOAD = PayloadSelectorInclude(include=['recipe_name', 'name', 'title', NAME_FIELD])
+# Payload patches per batch_update_points request (moderate batches; 1k+ slows the server)
+WRITE_BATCH = 128
+# Points ingested before `recipe_name_lc` existed; only these need the client-side name check
+LEGACY_FILTER = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key=NAME_FIELD))])
+# Full scans run as 2 concurrent scrolls over disjoint id ranges (more in-flight requests
+# mostly add server-side latency). ingest.py assigns uuid4 ids, so the middle of the UUID
+# space splits the collection roughly in half; Qdrant orders integer ids before UUIDs.
+SCAN_WORKERS = 2
+ID_PIVOT = '80000000-0000-0000-0000-000000000000'
 
-    while True:
-        resp = client.scroll(collection_name=COLLECTION_NAME, limit=batch, offset=offset, with_payload=True)
-        points = None
-        if hasattr(resp, 'points'):
-            points = resp.points
-        elif isinstance(resp, dict) and 'result' in resp:
-            points = resp['result']
-        elif isinstance(resp, dict) and 'points' in resp:
-            points = resp['points']
-        else:
-            points = resp
 
-        if not points:
+def normalize_name(name: str) -> str:
+    # must match how ingest.py fills `recipe_name_lc`; casefold also folds e.g. 'ß' -> 'ss'
+    return name.strip().casefold()
+
+
+def record_name(record):
+    # scroll yields models.Record over both REST and gRPC, so no per-point shape checks are needed
+    payload = record.payload or {}
+    return payload.get('recipe_name') or payload.get('name') or payload.get('title')
+
+
+def ensure_name_index(client):
+    """Create the keyword index on `recipe_name_lc` (Qdrant treats an existing index as a no-op)."""
+    try:
+        client.create_payload_index(collection_name=COLLECTION_NAME, field_name=NAME_FIELD, field_schema=PayloadSchemaType.KEYWORD)
+    except Exception as e:
+        log.warning('Could not create payload index on %s: %s', NAME_FIELD, e)
+
+
+def iter_scroll(client, scroll_filter, page_size):
+    """Yield every point matching `scroll_filter`, threading scroll's next_page_offset cursor."""
+    next_offset = None
+    while True:
+        points, next_offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=scroll_filter,
+            limit=page_size,
+            offset=next_offset,
+            with_payload=MATCH_PAYLOAD,
+            with_vectors=False
+        )
+        yield from points
+        if next_offset is None:
             break
 
-        for p in points:
-            # support object or dict shapes
-            item = p
-            if isinstance(p, (list, tuple)):
-                item = p[0]
-
-            payload = item.payload if hasattr(item, 'payload') else (item.get('payload') if isinstance(item, dict) else {})
-            recipe_name = payload.get('recipe_name') or payload.get('name') or payload.get('title')
-            if recipe_name and recipe_name.strip().lower() == name.strip().lower():
-                found_any = True
-                pid = item.id if hasattr(item, 'id') else item.get('id')
-                raw_text = payload.get('text', '')
-                print(f'Found point id={pid} name={recipe_name}')
-
-                if use_llm:
-                    try:
-                        res = llm_extract_structured(raw_text, recipe_name, target_language='indonesian')
-                        new_ings = res.get('ingredients', [])
-                        new_instr = res.get('instructions', [])
-                    except Exception as e:
-                        print('LLM failed, falling back to heuristics:', e)
-                        new_ings = extract_ingredients_from_text(raw_text)
-                        new_instr = extract_steps(raw_text, recipe_name)
-                else:
-                    new_ings = extract_ingredients_from_text(raw_text)
-                    new_instr = extract_steps(raw_text, recipe_name)
-
-                payload_update = {}
-                if new_ings:
-                    payload_update['ingredients'] = new_ings
-                if new_instr:
-                    payload_update['instructions'] = new_instr
-
-                if not payload_update:
-                    print('No structured data found to write.')
-                else:
-                    try:
-                        client.update_point(collection_name=COLLECTION_NAME, point_id=pid, payload=payload_update)
-                        print('Updated payload for', pid)
-                    except Exception as e:
-                        print('update_point failed, attempting upsert fallback:', e)
-                        try:
-                            client.upsert(collection_name=COLLECTION_NAME, points=[{'id': pid, 'payload': payload_update}])
-                            print('Upsert fallback wrote payload for', pid)
-                        except Exception as ee:
-                            print('Upsert failed:', ee)
-
-        offset += batch
-
-    if not found_any:
-        print('No recipe with that name found in collection.')
+
+def _id_key(pid):
+    # sort key matching Qdrant's point-id order: integers first, then UUIDs by value
+    return (1, uuid.UUID(str(pid)).int) if isinstance(pid, str) else (0, pid)
+
+
+def iter_scroll_parallel(client, scroll_filter, page_size):
+    """Like iter_scroll, but the id space is split at ID_PIVOT and both halves are scrolled concurrently.
+
+    Each shard's next page is requested before the current one is yielded, so at most
+    SCAN_WORKERS scroll calls are in flight. Points from the two shards arrive interleaved.
+    """
+    pivot = _id_key(ID_PIVOT)
+    shards = {}
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        def submit(offset, stop):
+            future = executor.submit(
+                client.scroll,
+                collection_name=COLLECTION_NAME,
+                scroll_filter=scroll_filter,
+                limit=page_size,
+                offset=offset,
+                with_payload=MATCH_PAYLOAD,
+                with_vectors=False
+            )
+            shards[future] = stop
+
+        submit(None, pivot)
+        submit(ID_PIVOT, None)
+        while shards:
+            done, _ = wait(shards, return_when=FIRST_COMPLETED)
+            for future in done:
+                stop = shards.pop(future)
+                points, next_offset = future.result()
+                if stop is not None:
+                    points = [p for p in points if _id_key(p.id) < stop]
+                    if next_offset is not None and _id_key(next_offset) >= stop:
+                        next_offset = None
+                if next_offset is not None:
+                    submit(next_offset, stop)
+                yield from points
+
+
+def find_points(client, names):
+    """Yield the points whose normalized name is one of `names` (one server-side filter, no full scan).
+
+    If some names have no indexed match, fall back to a cursor scan over legacy points without
+    `recipe_name_lc`; their names are compared by the caller.
+    """
+    targets = {normalize_name(n) for n in names}
+    seen = set()
+    name_filter = Filter(must=[FieldCondition(key=NAME_FIELD, match=MatchAny(any=sorted(targets)))])
+    for p in iter_scroll(client, name_filter, FIND_LIMIT if len(targets) == 1 else SCAN_PAGE):
+        seen.add((p.payload or {}).get(NAME_FIELD))
+        yield p
+    if targets - seen:
+        yield from iter_scroll_parallel(client, LEGACY_FILTER, SCAN_PAGE)
+
+
+def extraction_key(raw_text: str, recipe_name: str, target_language: str = 'indonesian') -> str:
+    # only real Gemini replies are cached (see extract_structured_many)
+    return make_key('gemini', ','.join(LLM_EXTRACT_MODELS), LLM_EXTRACT_PROMPT_VERSION, target_language, recipe_name, raw_text)
+
+
+def extract_structured_many(matches, cache=None, target_language: str = 'indonesian') -> list:
+    """LLM extraction for many (recipe_name, raw_text) pairs, aligned with `matches`.
+
+    Cache hits are read from disk; the misses go through one concurrent
+    llm_extract_structured_batch call. An entry is None where no LLM reply could be used
+    (Gemini unavailable, every model failed, or malformed JSON after the re-asks); those are
+    never cached, so a later run retries the LLM instead of reusing the heuristic result.
+    Replies with neither ingredients nor instructions are used for this run but not cached either.
+    """
+    results = [None] * len(matches)
+    keys = [None] * len(matches)
+    if cache is not None:
+        for i, (recipe_name, raw_text) in enumerate(matches):
+            keys[i] = extraction_key(raw_text, recipe_name, target_language)
+            results[i] = cache.get(keys[i])
+
+    misses = [i for i, res in enumerate(results) if res is None]
+    fresh = llm_extract_structured_batch(
+        [matches[i][1] for i in misses],
+        [matches[i][0] for i in misses],
+        target_language=target_language,
+        fallback=False
+    )
+    for i, res in zip(misses, fresh):
+        results[i] = res
+        if cache is not None and res is not None and (res.get('ingredients') or res.get('instructions')):
+            try:
+                cache.put(keys[i], res)
+            except Exception as e:
+                log.warning('Could not cache extraction: %s', e)
+    return results
+
+
+def build_update(recipe_name: str, raw_text: str, res=None) -> dict:
+    """Payload patch from an extraction result; local heuristics when `res` is None."""
+    if res is not None:
+        new_ings = res.get('ingredients', [])
+        new_instr = res.get('instructions', [])
+    else:
+        new_ings = extract_ingredients_from_text(raw_text)
+        new_instr = extract_steps(raw_text, recipe_name)
+
+    payload_update = {}
+    if new_ings:
+        payload_update['ingredients'] = new_ings
+    if new_instr:
+        payload_update['instructions'] = new_instr
+    return payload_update
+
+
+def write_updates(updates) -> int:
+    """Write [(point_id, payload_patch), ...] as SetPayload operations, WRITE_BATCH per request.
+
+    Only the patched keys are sent (the vector is not re-sent or re-indexed); wait=False because
+    nothing here reads the writes back. Returns the number of points written.
+    """
+    written = 0
+    for start in range(0, len(updates), WRITE_BATCH):
+        chunk = updates[start:start + WRITE_BATCH]
+        try:
+            written += set_payload_batch(chunk, wait=False)
+            log.debug('Updated payload for %s', ', '.join(str(pid) for pid, _ in chunk))
+        except Exception as e:
+            log.warning('set_payload failed for %d point(s): %s', len(chunk), e)
+    return written
+
+
+def load_names(path: str) -> list:
+    """One recipe name per line; blank lines are skipped."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def find_and_update(names, use_llm: bool = True, cache=None, first_match: bool = True):
+    """Update the points whose name matches `names` (a single name or a list of names).
+
+    With `first_match`, names are treated as unique: only the first point per name is updated
+    and the scroll stops as soon as every name has been found.
+    """
+    if isinstance(names, str):
+        names = [names]
+    targets = {normalize_name(n) for n in names}
+    client = get_client()
+    ensure_name_index(client)
+    matched = set()
+    remaining = set(targets)
+
+    matches = []
+    points = find_points(client, targets)
+    for p in points:
+        recipe_name = record_name(p)
+        if not recipe_name:
+            continue
+        key = normalize_name(recipe_name)
+        if key not in (remaining if first_match else targets):
+            continue
+        matched.add(key)
+        log.debug('Found point id=%s name=%s', p.id, recipe_name)
+        matches.append((p.id, recipe_name))
+        if first_match:
+            remaining.discard(key)
+            if not remaining:
+                break
+    # stop requesting further scroll pages (the parallel legacy scan); in-flight ones are left to finish
+    points.close()
+
+    # one retrieve for the (large) text of all matches instead of shipping it with every scrolled page
+    texts = retrieve_payloads([pid for pid, _ in matches], ['text'])
+    matches = [(pid, recipe_name, texts.get(pid, {}).get('text', '')) for pid, recipe_name in matches]
+
+    # Offline (no GOOGLE_API_KEY) is an expected mode: say so once instead of warning per point;
+    # cache hits are still used
+    llm_online = rag_core.genai_available
+    if use_llm and not llm_online and matches:
+        log.info('Gemini is not configured; using local heuristics for uncached recipes.')
+
+    # All matches are extracted together (cache first, then concurrent LLM calls for the rest)
+    if use_llm:
+        results = extract_structured_many([(recipe_name, raw_text) for _, recipe_name, raw_text in matches], cache=cache)
+    else:
+        results = [None] * len(matches)
+    updates = []
+    for (pid, recipe_name, raw_text), res in zip(matches, results):
+        if use_llm and llm_online and res is None:
+            log.warning('LLM failed for %s, falling back to heuristics', pid)
+        payload_update = build_update(recipe_name, raw_text, res)
+        if payload_update:
+            updates.append((pid, payload_update))
+        else:
+            log.info('No structured data found to write for %s.', pid)
+    written = write_updates(updates)
+    log.info('Matched %d point(s), updated %d.', len(matches), written)
+
+    if not matched:
+        log.info('No recipe with that name found in collection.')
+    elif len(targets) > 1:
+        log.info('Matched %d of %d names.', len(matched), len(targets))
+        for missing in sorted(targets - matched):
+            log.info('  not found: %s', missing)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--name', required=True, help='Recipe name to find')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--name', help='Recipe name to find')
+    target.add_argument('--names-file', help='Text file with one recipe name per line (looked up in one filtered scroll)')
     parser.add_argument('--no-llm', action='store_true', help='Do not use LLM, use local heuristics')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory of cached LLM extractions')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the LLM, ignoring cached extractions')
+    parser.add_argument('--all-matches', dest='first_match', action='store_false',
+                        help='Update every point with a matching name (default: first match per name, then stop scrolling)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every matched/written point (DEBUG)')
     args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
-    find_and_update(args.name, use_llm=not args.no_llm)
+    cache = None if args.no_cache else ExtractionCache(args.cache_dir)
+    names = load_names(args.names_file) if args.names_file else [args.name]
+    find_and_update(names, use_llm=not args.no_llm, cache=cache, first_match=args.first_match)
 
 
 if __name__ == '__main__':